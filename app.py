@@ -48,20 +48,94 @@ Sources Used:
 34. https://www.w3schools.com/python/
 35. https://stackoverflow.com/questions/tagged/flask
 """
-from flask import Flask, flash, redirect, render_template, request, session
+from flask import (
+    Flask,
+    flash,
+    g,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    send_from_directory,
+    session,
+    url_for,
+)
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 from hashlib import pbkdf2_hmac
+import base64
+import csv
+import gzip
+import functools
+import hashlib
+import io
+import json
+import mimetypes
 import os
+import queue
+import re
 import sqlite3
+import threading
+from urllib.request import pathname2url
+
+from appcache import VersionedCache
+from catalogindex import CatalogIndex
+from suggest import SuggestIndex
+import buildassets
+import metrics
+import rankings
+import semesterstats
+import slowquery
+from writequeue import GroupCommitWriter, WriteBusy
+from loginguard import (
+    LoginBusy,
+    LoginThrottled,
+    admitattempt,
+    loginstats,
+    runverification,
+    usernamelimiter,
+)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("APPSECRETKEY", "dev-secret-key-change-me")
 
+# behind a reverse proxy, trust its x-forwarded-for so per-ip login limits see clients
+TRUSTEDPROXIES = int(os.environ.get("TRUSTEDPROXIES", "0"))
+if TRUSTEDPROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTEDPROXIES, x_proto=TRUSTEDPROXIES)
+
 
 # read db path from env so deploys can pick custom storage
 def getdbpath():
     return os.environ.get("COURSEDBPATH", "courses.db")
 
 
+# catalog file published by initdb next to the db, see initdb.catalogpathfor
+def getcatalogpath():
+    override = os.environ.get("COURSECATALOGDBPATH", "")
+    if override:
+        return override
+    root, extension = os.path.splitext(getdbpath())
+    return f"{root}catalog{extension or '.db'}"
+
+
+# identity of the published catalog, changes every time initdb swaps in a new file
+def catalogstamp(catalogpath):
+    try:
+        found = os.stat(catalogpath)
+    except OSError:
+        return None
+    return (found.st_ino, found.st_mtime_ns)
+
+
+def sqliteuri(path, options=""):
+    uri = "file:" + pathname2url(os.path.abspath(path))
+    return uri + "?" + options if options else uri
+
+
 # make sure parent folder exists before sqlite tries to open file
 def ensuredbdir(dbpath):
     dbdir = os.path.dirname(dbpath)
@@ -70,15 +144,141 @@ def ensuredbdir(dbpath):
         os.makedirs(dbdir, exist_ok=True)
 
 
+# how many idle connections each worker keeps around
+POOLSIZE = int(os.environ.get("COURSEDBPOOLSIZE", "4"))
+
+# tuning applied once when a connection is opened, not per request
+CONNECTIONPRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+]
+# the catalog never changes in place, so it can be mapped and cached freely
+CATALOGPRAGMAS = [
+    "PRAGMA catalog.mmap_size = 268435456",
+    "PRAGMA catalog.cache_size = -8000",
+]
+
+# per-worker pool of idle connections, newest first so page cache stays warm
+connectionpool = queue.LifoQueue(maxsize=POOLSIZE)
+poollock = threading.Lock()
+poolstats = {"opened": 0, "closed": 0, "checkouts": 0, "reused": 0, "inuse": 0}
+readydbdirs = set()
+# callbacks run on every new connection, e.g. to attach tracing
+connectionhooks = []
+
+
+# plain connection that can remember which catalog file it attached
+class PooledConnection(sqlite3.Connection):
+    catalogstamp = None
+
+
+# timed connections only when metrics or the slow query log are on, plain sqlite otherwise
+if metrics.ENABLED or slowquery.ENABLED:
+    connectionfactory = metrics.TimedConnection
+else:
+    connectionfactory = PooledConnection
+if metrics.ENABLED:
+    metrics.install(app, connectionhooks)
+if slowquery.ENABLED:
+    slowquery.install(metrics.statementobservers)
+
+
 # open sqlite database
 def openconnection():
     dbpath = getdbpath()
-    ensuredbdir(dbpath)
-    con = sqlite3.connect(dbpath)
+    if dbpath not in readydbdirs:
+        # only touch the filesystem the first time this worker sees a path
+        ensuredbdir(dbpath)
+        readydbdirs.add(dbpath)
+    # pooled connections can be handed between threads, never shared at once
+    con = sqlite3.connect(
+        sqliteuri(dbpath), uri=True, check_same_thread=False, factory=connectionfactory
+    )
     con.row_factory = sqlite3.Row
+    for pragma in CONNECTIONPRAGMAS:
+        con.execute(pragma)
+    # immutable tells sqlite to skip locks and change checks on the catalog, which
+    # holds because initdb only ever publishes a new file by rename
+    catalogpath = getcatalogpath()
+    con.catalogstamp = catalogstamp(catalogpath)
+    con.execute(
+        "ATTACH DATABASE ? AS catalog",
+        (sqliteuri(catalogpath, "mode=ro&immutable=1"),),
+    )
+    for pragma in CATALOGPRAGMAS:
+        con.execute(pragma)
+    for hook in connectionhooks:
+        hook(con)
+    with poollock:
+        poolstats["opened"] += 1
+    return con
+
+
+# take an idle connection from the pool or open a fresh one
+def checkoutconnection():
+    dbpath = getdbpath()
+    stamp = catalogstamp(getcatalogpath())
+    con = None
+    while con is None:
+        try:
+            pooledpath, pooled = connectionpool.get_nowait()
+        except queue.Empty:
+            break
+        if pooledpath == dbpath and pooled.catalogstamp == stamp:
+            con = pooled
+        else:
+            # db path changed or a new catalog was published, drop the old connection
+            closeconnection(pooled)
+
+    with poollock:
+        poolstats["checkouts"] += 1
+        poolstats["inuse"] += 1
+        if con is not None:
+            poolstats["reused"] += 1
+    if con is None:
+        con = openconnection()
     return con
 
 
+# hand a connection back so the next request can reuse it
+def returnconnection(con):
+    with poollock:
+        poolstats["inuse"] -= 1
+    try:
+        if con.in_transaction:
+            # never leak half-finished writes into the next request
+            con.rollback()
+        connectionpool.put_nowait((getdbpath(), con))
+    except (sqlite3.Error, queue.Full):
+        # broken or surplus connection gets closed instead of pooled
+        closeconnection(con)
+
+
+# close a connection for good and count it
+def closeconnection(con):
+    con.close()
+    with poollock:
+        poolstats["closed"] += 1
+
+
+# one connection per app context, shared by user lookup and the route
+def getconnection():
+    if "con" not in g:
+        g.con = checkoutconnection()
+    return g.con
+
+
+@app.teardown_appcontext
+def releaseconnection(error):
+    con = g.pop("con", None)
+    if con is not None:
+        returnconnection(con)
+
+
 # verify password hash using same algo format we store in init script
 def verifypassword(storedhash, rawpassword):
     try:
@@ -104,28 +304,597 @@ def verifypassword(storedhash, rawpassword):
     return checkdigest == digest
 
 
-# fetch logged-in user from session id, or return none if no login
+# cached results live until the data version moves or the ttl runs out
+CACHETTL = int(os.environ.get("COURSECACHETTL", "300"))
+statscache = VersionedCache("stats", maxsize=4, ttl=CACHETTL)
+# signed-in identities keyed by user id, versioned by meta authversion instead
+usercache = VersionedCache("users", maxsize=1024, ttl=CACHETTL)
+# rendered course cards keyed by (course id, coursestats version), the key
+# changes when the course does, so this cache ignores the data version
+cardcache = VersionedCache(
+    "cards",
+    maxsize=int(os.environ.get("CARDCACHESIZE", "5000")),
+    ttl=int(os.environ.get("CARDCACHETTL", "3600")),
+)
+# ordered sort keys per canonical filter set, hydrated from course rows
+resultcache = VersionedCache(
+    "results", maxsize=int(os.environ.get("RESULTCACHESIZE", "64")), ttl=CACHETTL
+)
+courserowcache = VersionedCache(
+    "courserows", maxsize=int(os.environ.get("COURSEROWCACHESIZE", "5000")), ttl=CACHETTL
+)
+# one gzipped catalog bundle, rebuilt when the data version moves
+CATALOGTTL = int(os.environ.get("CATALOGTTL", "86400"))
+catalogcache = VersionedCache("catalog", maxsize=1, ttl=CATALOGTTL)
+# in-memory filter and facet index, rebuilt when the data version moves
+catalogindexcache = VersionedCache("catalogindex", maxsize=1, ttl=CATALOGTTL)
+# typeahead prefix arrays, versioned by the catalog file rather than the data
+suggestcache = VersionedCache("suggest", maxsize=1, ttl=CATALOGTTL)
+appcaches = [
+    catalogindexcache,
+    suggestcache,
+    statscache,
+    usercache,
+    resultcache,
+    courserowcache,
+    cardcache,
+    catalogcache,
+]
+
+
+# meta counters, read once per request in a single query
+def getmeta():
+    if "meta" not in g:
+        rows = getconnection().execute(
+            """
+            SELECT key, value
+            FROM meta
+            WHERE key IN ('dataversion', 'datamodified', 'authversion')
+            """
+        ).fetchall()
+        g.meta = {row["key"]: row["value"] for row in rows}
+    return g.meta
+
+
+def getdataversion():
+    return getmeta().get("dataversion", 0)
+
+
+# last write time as a utc datetime for last-modified headers
+def getdatamodified():
+    return datetime.fromtimestamp(getmeta().get("datamodified", 0), timezone.utc)
+
+
+# hashed bundle names written by buildassets.py, empty until the build has run
+# and then pages fall back to the cdn and the plain static files
+def loadassetmanifest():
+    try:
+        with open(buildassets.MANIFESTPATH, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+assetmanifest = loadassetmanifest()
+assetfiles = set(os.listdir(buildassets.ASSETDIR)) if assetmanifest else set()
+
+
+# url_for("static", filename="site.css") resolves to the current hashed bundle
+@app.url_defaults
+def hashedstaticurl(endpoint, values):
+    if endpoint == "static" and values.get("filename") in assetmanifest:
+        values["filename"] = "assets/" + assetmanifest[values["filename"]]
+
+
+@app.context_processor
+def assetcontext():
+    return {"assetmanifest": assetmanifest}
+
+
+# templates feed every page, so a deploy that edits them must change etags
+# the asset manifest too, cached pages must not point at a removed bundle
+def hashtemplates():
+    digest = hashlib.sha1()
+    templatedir = os.path.join(app.root_path, "templates")
+    for name in sorted(os.listdir(templatedir)):
+        with open(os.path.join(templatedir, name), "rb") as file:
+            digest.update(file.read())
+    digest.update(json.dumps(assetmanifest, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+TEMPLATEDIGEST = hashtemplates()
+
+
+# validator built from what the page depends on: data, url args, and viewer
+def buildetag(userid):
+    args = sorted(request.args.items(multi=True))
+    parts = [TEMPLATEDIGEST, getdataversion(), request.path, args, userid]
+    if userid is not None:
+        # revoked sessions must not keep revalidating a signed-in page
+        parts.append(getmeta().get("authversion", 0))
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+# answer repeat gets with 304 before any heavy query or template work runs
+def conditionalget(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or "_flashes" in session:
+            # posts and pages carrying one-time flash messages always render
+            return view(*args, **kwargs)
+
+        userid = session.get("userid")
+        etag = buildetag(userid)
+        lastmodified = getdatamodified()
+
+        if request.if_none_match:
+            # etag wins when the client sent one
+            notmodified = request.if_none_match.contains_weak(etag)
+        else:
+            # bare if-modified-since is only safe for guests, who all share a page
+            since = request.if_modified_since
+            notmodified = (
+                userid is None and since is not None and lastmodified <= since
+            )
+
+        if notmodified:
+            response = app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                # errors are not worth revalidating
+                return response
+
+        response.set_etag(etag, weak=True)
+        response.last_modified = lastmodified
+        if userid is None:
+            # shared caches may keep guest pages but must revalidate each time
+            response.cache_control.public = True
+        else:
+            # signed in pages show the username, keep them out of shared caches
+            response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response
+
+    return wrapper
+
+
+# shared 1-5 rating checks for the review form and bulk imports
+# returns (values, "") with values ready for savereviews minus the course id,
+# or (none, error text) when the submission should be rejected
+def validatereview(formvalue, actiontype):
+    overall = None
+    difficulty = None
+    workload = None
+    interest = None
+
+    # parse all star fields as whole numbers
+    try:
+        overall = int(formvalue["overall"])
+        difficulty = int(formvalue["difficulty"])
+        workload = int(formvalue["workload"])
+        interest = int(formvalue["interest"])
+    except ValueError:
+        # leave values as none so validation below fails cleanly
+        pass
+
+    if (
+        overall is None
+        or difficulty is None
+        or workload is None
+        or interest is None
+        or overall < 1
+        or overall > 5
+        or difficulty < 1
+        or difficulty > 5
+        or workload < 1
+        or workload > 5
+        or interest < 1
+        or interest > 5
+    ):
+        # invalid star values path
+        return None, "All rating fields must be whole numbers from 1 to 5."
+    if actiontype == "review" and len(formvalue["reviewtext"]) < 10:
+        # review mode requires enough text content
+        return None, "Review text must be at least 10 characters."
+
+    # rating-only posts can skip text and use fallback message
+    commenttext = formvalue["reviewtext"]
+    if actiontype == "rating" and not commenttext:
+        commenttext = "Rating only submission."
+    return (
+        overall,
+        difficulty,
+        workload,
+        interest,
+        commenttext,
+        formvalue["semester"],
+    ), ""
+
+
+# insert reviews and fold them into course stats in the caller's transaction
+# rows use (courseid, overall, difficulty, workload, interest, text, semester)
+def savereviews(con, rows):
+    con.executemany(
+        """
+        INSERT INTO reviews (
+            courseid,
+            overallrating,
+            difficulty,
+            workload,
+            interest,
+            reviewtext,
+            semester
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+
+    # sum the batch per course so each stats row is written once
+    deltas = {}
+    for row in rows:
+        delta = deltas.setdefault(row[0], [0, 0, 0, 0, 0])
+        delta[0] += 1
+        delta[1] += row[1]
+        delta[2] += row[2]
+        delta[3] += row[3]
+        delta[4] += row[4]
+
+    # the smoothed score moves with the sums, right sides read the old row
+    con.executemany(
+        f"""
+        INSERT INTO coursestats (
+            courseid,
+            reviewcount,
+            ratingsum,
+            difficultysum,
+            workloadsum,
+            interestsum,
+            score
+        )
+        VALUES (?, ?, ?, ?, ?, ?, {rankings.scoresql("?", "?")})
+        ON CONFLICT (courseid) DO UPDATE SET
+            reviewcount = reviewcount + excluded.reviewcount,
+            ratingsum = ratingsum + excluded.ratingsum,
+            difficultysum = difficultysum + excluded.difficultysum,
+            workloadsum = workloadsum + excluded.workloadsum,
+            interestsum = interestsum + excluded.interestsum,
+            score = {rankings.scoresql(
+                "ratingsum + excluded.ratingsum", "reviewcount + excluded.reviewcount"
+            )},
+            version = version + 1
+        """,
+        [(courseid, *delta, delta[1], delta[0]) for courseid, delta in deltas.items()],
+    )
+    # department comes from the catalog for the rollup and the leaderboards
+    courseids = list(deltas)
+    departments = {
+        row[0]: row[1]
+        for row in con.execute(
+            f"SELECT id, department FROM courses WHERE id IN ({', '.join('?' * len(courseids))})",
+            courseids,
+        )
+    }
+    # new reviews have no dateposted yet, termfor uses today for those
+    semesterstats.addsemesterstats(
+        con,
+        semesterstats.foldreviews(
+            [(*row[:5], row[6], None) for row in rows], departments
+        ),
+    )
+    # rewrite only the top lists the courses in this batch sit in
+    rankings.setdepartments(con, departments)
+    rankings.refreshleaderboards(con, departments.values())
+
+    # invalidates cached facets and pages in every worker
+    con.execute(
+        """
+        UPDATE meta
+        SET value = CASE key
+            WHEN 'dataversion' THEN value + 1
+            ELSE CAST(strftime('%s', 'now') AS INTEGER)
+        END
+        WHERE key IN ('dataversion', 'datamodified')
+        """
+    )
+
+
+# the writer keeps its connection across batches, so it has to notice a newly
+# published catalog the same way checkoutconnection does
+def catalogchanged(con):
+    return con.catalogstamp != catalogstamp(getcatalogpath())
+
+
+# review posts from every request in this worker share group commits
+reviewwriter = GroupCommitWriter("reviews", openconnection, savereviews, catalogchanged)
+
+
+# remember per db path whether initdb managed to build the fts5 index
+searchindexready = {}
+
+
+def hassearchindex(con):
+    dbpath = getdbpath()
+    if dbpath not in searchindexready:
+        found = con.execute(
+            """
+            SELECT 1 FROM catalog.sqlite_master
+            WHERE type = 'table' AND name = 'coursesearch'
+            """
+        ).fetchone()
+        searchindexready[dbpath] = found is not None
+    return searchindexready[dbpath]
+
+
+# turn free text into an fts5 prefix query like "calc"* "bc"*
+def buildmatchquery(search):
+    tokens = re.findall(r"\w+", search.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+# default page sizes, override per deploy
+COURSEPAGESIZE = int(os.environ.get("COURSEPAGESIZE", "30"))
+REVIEWPAGESIZE = int(os.environ.get("REVIEWPAGESIZE", "20"))
+MAXPAGESIZE = 100
+
+
+# page size from ?pagesize=, clamped so one request stays bounded
+def getpagesize(default):
+    try:
+        pagesize = int(request.args.get("pagesize", ""))
+    except ValueError:
+        return default
+    return max(1, min(pagesize, MAXPAGESIZE))
+
+
+# cursors are the sort key of a boundary row, packed into url-safe text
+def encodecursor(values):
+    packed = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(packed).decode("ascii").rstrip("=")
+
+
+def decodecursor(text, size):
+    if not text:
+        return None
+    try:
+        padded = text + "=" * (-len(text) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        # tampered or truncated cursor just restarts from page one
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+# review cursors are (dateposted, id) and go to sqlite as parameters, so
+# anything but a text date and a 64-bit id restarts from page one
+def decodereviewcursor(text):
+    values = decodecursor(text, 2)
+    if values is None:
+        return None
+    dateposted, reviewid = values
+    if not isinstance(dateposted, str) or type(reviewid) is not int:
+        return None
+    if not -(2**63) <= reviewid < 2**63:
+        return None
+    try:
+        # lone surrogates from \ud800 style escapes cannot be bound either
+        dateposted.encode("utf-8")
+    except UnicodeEncodeError:
+        return None
+    return values
+
+
+# one page of a course's reviews, newest first, seeking past ?after= or
+# before ?before= on (dateposted, id) with a row value comparison
+# returns rows plus cursors for the next and previous pages (or none)
+def fetchreviewpage(con, courseid, pagesize):
+    query = """
+        SELECT id, courseid, overallrating, difficulty, workload, interest, reviewtext, semester, dateposted
+        FROM reviews
+        WHERE courseid = ?
+    """
+    params = [courseid]
+    after = decodereviewcursor(request.args.get("after", "").strip())
+    before = None
+    if after is None:
+        before = decodereviewcursor(request.args.get("before", "").strip())
+
+    reverse = False
+    if after is not None:
+        # next page: older rows than the cursor
+        query += " AND (dateposted, id) < (?, ?) ORDER BY dateposted DESC, id DESC"
+        params.extend(after)
+    elif before is not None:
+        # previous page: walk forward from the cursor then flip the rows
+        query += " AND (dateposted, id) > (?, ?) ORDER BY dateposted, id"
+        params.extend(before)
+        reverse = True
+    else:
+        query += " ORDER BY dateposted DESC, id DESC"
+    # one extra row tells us whether another page exists
+    query += " LIMIT ?"
+    params.append(pagesize + 1)
+
+    rows = con.execute(query, params).fetchall()
+    hasmore = len(rows) > pagesize
+    rows = rows[:pagesize]
+    if reverse:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    firstkey = encodecursor([rows[0]["dateposted"], rows[0]["id"]])
+    lastkey = encodecursor([rows[-1]["dateposted"], rows[-1]["id"]])
+    if reverse:
+        # came from a later page, so a next page always exists
+        return rows, lastkey, firstkey if hasmore else None
+    nextcursor = lastkey if hasmore else None
+    prevcursor = firstkey if after is not None else None
+    return rows, nextcursor, prevcursor
+
+
+# build a page link keeping filters, or none when there is no such page
+def pageurl(endpoint, pageargs, **cursor):
+    if not any(cursor.values()):
+        return None
+    return url_for(endpoint, **pageargs, **cursor)
+
+
+# fetch logged-in user from the signed session, or return none if no login
+# the users row is only read on cache miss or when the session generation is stale
 def getcurrentuser():
     userid = session.get("userid")
     if not userid:
         # no active session means guest user
         return None
 
-    con = openconnection()
-    user = con.execute(
-        "SELECT id, username FROM users WHERE id = ?",
+    generation = session.get("generation")
+    authversion = getmeta().get("authversion", 0)
+    found, cached = usercache.lookup(userid, authversion)
+    if found and cached["generation"] == generation:
+        return cached
+
+    con = getconnection()
+    row = con.execute(
+        "SELECT id, username, sessiongeneration FROM users WHERE id = ?",
         (userid,),
     ).fetchone()
-    con.close()
+    if row is None or (
+        generation is not None and generation != row["sessiongeneration"]
+    ):
+        # deleted user or revoked session, treat as guest from now on
+        clearlogin()
+        return None
+
+    user = {
+        "id": row["id"],
+        "username": row["username"],
+        "generation": row["sessiongeneration"],
+    }
+    if generation is None:
+        # sessions from before generations existed get upgraded in place
+        storelogin(user)
+    usercache.store(userid, user, authversion)
     return user
 
 
+# identity carried in the signed session cookie
+def storelogin(user):
+    session["userid"] = user["id"]
+    session["username"] = user["username"]
+    session["generation"] = user["generation"]
+
+
+def clearlogin():
+    session.pop("userid", None)
+    session.pop("username", None)
+    session.pop("generation", None)
+
+
 @app.route("/health")
 def health():
     # simple uptime check endpoint for hosting platforms
     return "ok", 200
 
 
+@app.route("/health/cache")
+def healthcache():
+    # hit and miss counters for this worker's result caches
+    return jsonify(
+        {
+            "pid": os.getpid(),
+            "caches": [cache.stats() for cache in appcaches],
+        }
+    )
+
+
+@app.route("/health/login")
+def healthlogin():
+    # admission counters for the login verify pool
+    stats = loginstats()
+    stats["pid"] = os.getpid()
+    return jsonify(stats)
+
+
+@app.route("/health/writes")
+def healthwrites():
+    # group commit counters for this worker's review writer
+    stats = reviewwriter.writerstats()
+    stats["pid"] = os.getpid()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metricsendpoint():
+    # prometheus text for this worker, only when APPMETRICS=1
+    if not metrics.ENABLED:
+        return "metrics disabled", 404
+    with poollock:
+        pool = dict(poolstats)
+    pool["idle"] = connectionpool.qsize()
+    cachestats = [cache.stats() for cache in appcaches]
+    gauges = [
+        (
+            "courseapp_pool_connections",
+            "Connection pool counters for this worker.",
+            "gauge",
+            [({"state": key}, value) for key, value in sorted(pool.items())],
+        ),
+        (
+            "courseapp_cache_hits_total",
+            "Cache hits per result cache.",
+            "counter",
+            [({"cache": stats["name"]}, stats["hits"]) for stats in cachestats],
+        ),
+        (
+            "courseapp_cache_misses_total",
+            "Cache misses per result cache.",
+            "counter",
+            [({"cache": stats["name"]}, stats["misses"]) for stats in cachestats],
+        ),
+        (
+            "courseapp_review_writes_total",
+            "Group commit batches, rows, retries, and failures.",
+            "counter",
+            [
+                ({"event": key}, value)
+                for key, value in sorted(reviewwriter.writerstats().items())
+                if key not in {"queued", "largestbatch", "batchms", "batchrows"}
+            ],
+        ),
+        (
+            "courseapp_login_events_total",
+            "Login admission outcomes.",
+            "counter",
+            [
+                ({"outcome": key}, value)
+                for key, value in sorted(loginstats().items())
+                if key not in {"workers", "queue"}
+            ],
+        ),
+    ]
+    return app.response_class(
+        metrics.render(gauges), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.route("/health/pool")
+def healthpool():
+    # connection pool counters for this worker process
+    with poollock:
+        stats = dict(poolstats)
+    stats["idle"] = connectionpool.qsize()
+    stats["size"] = POOLSIZE
+    stats["pid"] = os.getpid()
+    return jsonify(stats)
+
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     # already logged in users just go home
@@ -138,16 +907,48 @@ def login():
         # read login form values
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "")
-        con = openconnection()
+        try:
+            # cheap per-ip and per-username budgets before any hashing
+            admitattempt(username, request.remote_addr or "")
+        except LoginThrottled as throttled:
+            return loginrejected(
+                "Too many login attempts. Try again shortly.",
+                429,
+                throttled.retryafter,
+            )
+
+        con = getconnection()
         user = con.execute(
-            "SELECT id, username, passwordhash FROM users WHERE username = ?",
+            """
+            SELECT id, username, passwordhash, sessiongeneration
+            FROM users
+            WHERE username = ?
+            """,
             (username,),
         ).fetchone()
-        con.close()
 
-        if user and verifypassword(user["passwordhash"], password):
+        verified = False
+        if user:
+            try:
+                # pbkdf2 runs on the small login pool, not inline in this worker
+                verified = runverification(
+                    verifypassword, user["passwordhash"], password
+                )
+            except LoginBusy:
+                return loginrejected(
+                    "Login is busy right now. Try again in a moment.", 503, 2
+                )
+
+        if verified:
             # store user id in session after successful login
-            session["userid"] = user["id"]
+            usernamelimiter.reset(username.lower())
+            storelogin(
+                {
+                    "id": user["id"],
+                    "username": user["username"],
+                    "generation": user["sessiongeneration"],
+                }
+            )
             flash("Welcome back.", "success")
             return redirect("/")
         # keep user on login page with generic error text
@@ -157,20 +958,32 @@ def login():
     return render_template("login.html", error=error, currentuser=currentuser)
 
 
+# fast rejection page for throttled or overloaded login attempts
+def loginrejected(error, status, retryafter):
+    response = make_response(
+        render_template("login.html", error=error, currentuser=None), status
+    )
+    response.headers["Retry-After"] = str(retryafter)
+    return response
+
+
 @app.route("/logout", methods=["POST"])
 def logout():
-    # clear session id and send user home
-    session.pop("userid", None)
+    # clear session identity and send user home
+    clearlogin()
     flash("You have been logged out.", "info")
     return redirect("/")
 
 
 # homepage: show all courses
 @app.route("/")
+@conditionalget
 def home():
     # collect optional filters from url query params
     currentuser = getcurrentuser()
     search = request.args.get("search", "").strip()
+    # case and spacing never change matches, so fold them before building keys
+    searchkey = " ".join(search.casefold().split())
     department = request.args.get("department", "").strip()
     level = request.args.get("level", "").strip()
     if not (len(level) == 3 and level[0].isdigit() and level[1:] == "00"):
@@ -195,86 +1008,70 @@ def home():
             minratingraw = ""
             homewarning = "Minimum rating must be between 1 and 5."
 
-    con = openconnection()
-    departments = con.execute(
-        """
-        SELECT DISTINCT department
-        FROM courses
-        ORDER BY department
-        """
-    ).fetchall()
-    levels = con.execute(
-        """
-        SELECT DISTINCT CAST(SUBSTR(coursecode, 3, 1) AS INTEGER) * 100 level
-        FROM courses
-        WHERE SUBSTR(coursecode, 3, 1) GLOB '[0-9]'
-        ORDER BY level
-        """
-    ).fetchall()
-
-    # start with base query and append filters dynamically
-    query = """
-        SELECT
-            c.id,
-            c.coursecode,
-            c.coursename,
-            c.department,
-            c.professor,
-            c.description,
-            CASE
-                WHEN SUBSTR(c.coursecode, 3, 1) GLOB '[0-9]'
-                THEN CAST(SUBSTR(c.coursecode, 3, 1) AS INTEGER) * 100
-                ELSE NULL
-            END level,
-            ROUND(AVG(r.overallrating), 2) avgrating,
-            COUNT(r.id) reviewcount
-        FROM courses c
-        LEFT JOIN reviews r ON r.courseid = c.id
-    """
-
-    whereparts = []
-    params = []
-
-    if search:
-        # search against name, code, and professor
-        token = f"%{search}%"
-        whereparts.append(
-            "(c.coursename LIKE ? OR c.coursecode LIKE ? OR c.professor LIKE ?)"
-        )
-        params.extend([token, token, token])
-
+    con = getconnection()
+    dataversion = getdataversion()
+    # dropdown options and filter sets come from this worker's in-memory index
+    index = getcatalogindex(con, dataversion)
     if department:
-        # department filter path
-        whereparts.append("c.department = ?")
-        params.append(department)
-
-    if level:
-        # level filter path
-        whereparts.append("CAST(SUBSTR(c.coursecode, 3, 1) AS INTEGER) * 100 = ?")
-        params.append(int(level))
-
-    if whereparts:
-        # add where clause only when at least one filter exists
-        query += " WHERE " + " AND ".join(whereparts)
-
-    query += " GROUP BY c.id"
-
-    if minrating is not None:
-        # apply rating threshold after aggregation
-        query += " HAVING AVG(r.overallrating) >= ?"
-        params.append(minrating)
-
-    query += " ORDER BY c.department, c.coursecode"
+        # match the dropdown value whatever case the link used
+        departmentnames = {name.casefold(): name for name in index.departments}
+        department = departmentnames.get(department.casefold(), department)
+
+    matchquery = buildmatchquery(searchkey)
+    usesearchindex = bool(matchquery) and hassearchindex(con)
+
+    # canonical filter set, reordered or respelled args land on the same entry
+    resultkey = (
+        matchquery if usesearchindex else searchkey,
+        usesearchindex,
+        department,
+        level,
+        minrating,
+    )
+    resultkeys, departmentcounts, levelcounts = resultcache.getorcompute(
+        resultkey,
+        dataversion,
+        lambda: filtercatalog(
+            con,
+            index,
+            searchkey,
+            matchquery if usesearchindex else "",
+            department,
+            int(level) if level else None,
+            minrating,
+        ),
+    )
+    totalcourses = len(resultkeys)
 
-    courses = con.execute(query, params).fetchall()
-    con.close()
+    pagesize = getpagesize(COURSEPAGESIZE)
+    # search pages by (rank, id), everything else by (department, coursecode, id)
+    pagekeys, nextcursor, prevcursor = slicekeysetpage(
+        resultkeys, 2 if usesearchindex else 3, pagesize
+    )
+    courses = hydratecourses(con, [key[-1] for key in pagekeys], dataversion)
+
+    # keep the active filters on the next/prev links
+    pageargs = {
+        "search": search,
+        "department": department,
+        "level": level,
+        "minrating": minratingraw,
+        "pagesize": request.args.get("pagesize", "").strip(),
+    }
+    pageargs = {key: value for key, value in pageargs.items() if value}
 
     # render homepage with filters and query results
     return render_template(
         "home.html",
         courses=courses,
-        departments=departments,
-        levels=levels,
+        cards=rendercoursecards(courses),
+        totalcourses=totalcourses,
+        nexturl=pageurl("home", pageargs, after=nextcursor),
+        prevurl=pageurl("home", pageargs, before=prevcursor),
+        departments=index.departmentnames(),
+        levels=index.levelvalues(),
+        departmentcounts=departmentcounts,
+        levelcounts=levelcounts,
         search=search,
         department=department,
         level=level,
@@ -284,18 +1081,177 @@ def home():
     )
 
 
-@app.route("/stats")
-def stats():
-    # fetch summary numbers plus top 10 by volume and rating
-    currentuser = getcurrentuser()
-    con = openconnection()
+# answer the home filters from the catalog index, only search text goes to sqlite
+# returns (sort keys in page order, department counts, level counts)
+def filtercatalog(con, index, searchkey, matchquery, department, level, minrating):
+    searchbits = None
+    ranks = None
+    if matchquery:
+        # ranked full text match on code, name, professor, and description
+        ranks = dict(
+            con.execute(
+                """
+                SELECT rowid, bm25(coursesearch, 10.0, 5.0, 3.0, 1.0)
+                FROM coursesearch
+                WHERE coursesearch MATCH ?
+                """,
+                (matchquery,),
+            ).fetchall()
+        )
+        searchbits = index.bitsforids(ranks)
+    elif searchkey:
+        # no fts5 on this build, fall back to substring scan
+        token = f"%{searchkey}%"
+        matches = con.execute(
+            """
+            SELECT id
+            FROM courses
+            WHERE coursename LIKE ? OR coursecode LIKE ? OR professor LIKE ?
+                OR description LIKE ?
+            """,
+            (token, token, token, token),
+        ).fetchall()
+        searchbits = index.bitsforids(row[0] for row in matches)
+
+    bits, departmentcounts, levelcounts = index.query(
+        department, level, minrating, searchbits
+    )
+    records = index.recordsfor(bits)
+    if ranks is not None:
+        resultkeys = sorted((ranks[record.id], record.id) for record in records)
+    else:
+        # bit order is already department, coursecode, id order
+        resultkeys = [record.sortkey() for record in records]
+    return resultkeys, departmentcounts, levelcounts
+
+
+# same cursors as fetchreviewpage, but seeking a cached key list with bisect
+def slicekeysetpage(keys, keysize, pagesize):
+    after = decodecursor(request.args.get("after", "").strip(), keysize)
+    before = None
+    if after is None:
+        before = decodecursor(request.args.get("before", "").strip(), keysize)
 
+    try:
+        if after is not None:
+            start = bisect_right(keys, tuple(after))
+            end = start + pagesize
+        elif before is not None:
+            end = bisect_left(keys, tuple(before))
+            start = max(0, end - pagesize)
+        else:
+            start, end = 0, pagesize
+    except TypeError:
+        # cursor values of the wrong type restart from page one
+        start, end = 0, pagesize
+
+    pagekeys = keys[start:end]
+    if not pagekeys:
+        return pagekeys, None, None
+    nextcursor = encodecursor(list(pagekeys[-1])) if end < len(keys) else None
+    prevcursor = encodecursor(list(pagekeys[0])) if start > 0 else None
+    return pagekeys, nextcursor, prevcursor
+
+
+def getcatalogindex(con, dataversion):
+    return catalogindexcache.getorcompute(
+        "index",
+        dataversion,
+        lambda: CatalogIndex(
+            con.execute(
+                """
+                SELECT
+                    c.id,
+                    c.department,
+                    c.coursecode,
+                    c.level,
+                    COALESCE(s.ratingsum, 0),
+                    COALESCE(s.reviewcount, 0)
+                FROM courses c
+                LEFT JOIN coursestats s ON s.courseid = c.id
+                """
+            ).fetchall()
+        ),
+    )
+
+
+# prefix arrays follow the published catalog, review counts follow the data version
+def getsuggestindex(con, dataversion):
+    index = suggestcache.getorcompute(
+        "index",
+        catalogstamp(getcatalogpath()),
+        lambda: SuggestIndex(
+            con.execute(
+                "SELECT id, coursecode, coursename, professor FROM courses"
+            ).fetchall()
+        ),
+    )
+    if index.refreshdue(dataversion):
+        records = getcatalogindex(con, dataversion).records
+        index.setcounts({record.id: record.reviewcount for record in records}, dataversion)
+    return index
+
+
+# columns a course card needs, shared by every filter combination
+COURSEROWQUERY = """
+    SELECT
+        c.id,
+        c.coursecode,
+        c.coursename,
+        c.department,
+        c.professor,
+        c.level,
+        ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) avgrating,
+        COALESCE(s.reviewcount, 0) reviewcount,
+        COALESCE(s.version, 0) cardversion
+    FROM courses c
+    LEFT JOIN coursestats s ON s.courseid = c.id
+"""
+
+
+# course rows for a page of ids, one query for whatever the row cache lacks
+def hydratecourses(con, courseids, dataversion):
+    rows = {}
+    missing = []
+    for courseid in courseids:
+        found, row = courserowcache.lookup(courseid, dataversion)
+        if found:
+            rows[courseid] = row
+        else:
+            missing.append(courseid)
+    if missing:
+        marks = ", ".join("?" for courseid in missing)
+        for row in con.execute(COURSEROWQUERY + f" WHERE c.id IN ({marks})", missing):
+            courserowcache.store(row["id"], row, dataversion)
+            rows[row["id"]] = row
+    return [rows[courseid] for courseid in courseids if courseid in rows]
+
+
+# card html for each course row, only courses whose version moved get rendered
+def rendercoursecards(courses):
+    template = None
+    cards = []
+    for course in courses:
+        key = (course["id"], course["cardversion"])
+        found, card = cardcache.lookup(key, None)
+        if not found:
+            if template is None:
+                template = app.jinja_env.get_template("coursecard.html")
+            card = Markup(template.render(course=course))
+            cardcache.store(key, card, None)
+        cards.append(card)
+    return cards
+
+
+# totals plus both top 10 lists, cached until the next review write
+def loadleaderboards(con):
     totals = con.execute(
         """
         SELECT
             (SELECT COUNT(*) FROM courses) totalcourses,
-            (SELECT COUNT(*) FROM reviews) totalreviews,
-            ROUND((SELECT AVG(overallrating) FROM reviews), 2) averageoverall
+            COALESCE(SUM(reviewcount), 0) totalreviews,
+            ROUND(CAST(SUM(ratingsum) AS REAL) / SUM(reviewcount), 2) averageoverall
+        FROM coursestats
         """
     ).fetchone()
 
@@ -307,53 +1263,163 @@ def stats():
             c.coursecode,
             c.coursename,
             c.department,
-            ROUND(AVG(r.overallrating), 2) avgrating,
-            COUNT(r.id) reviewcount
-        FROM courses c
-        LEFT JOIN reviews r ON r.courseid = c.id
-        GROUP BY c.id
-        HAVING COUNT(r.id) > 0
+            ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) avgrating,
+            s.reviewcount
+        FROM coursestats s
+        JOIN courses c ON c.id = s.courseid
+        WHERE s.reviewcount > 0
         ORDER BY reviewcount DESC, avgrating DESC, c.coursecode
         LIMIT 10
         """
     ).fetchall()
 
-    # highest rated list prioritizes avg score first
-    highestrated = con.execute(
+    # highest rated list comes ready-made from the overall leaderboard
+    highestrated = loadleaderboard(con, rankings.ALLSCOPE, 10)
+    return totals, mostreviewed, highestrated
+
+
+# one precomputed top list, scope is a department or rankings.ALLSCOPE
+def loadleaderboard(con, scope, limit):
+    return con.execute(
         """
         SELECT
+            l.position,
             c.id,
             c.coursecode,
             c.coursename,
             c.department,
-            ROUND(AVG(r.overallrating), 2) avgrating,
-            COUNT(r.id) reviewcount
-        FROM courses c
-        LEFT JOIN reviews r ON r.courseid = c.id
-        GROUP BY c.id
-        HAVING COUNT(r.id) > 0
-        ORDER BY avgrating DESC, reviewcount DESC, c.coursecode
-        LIMIT 10
+            ROUND(l.score, 2) score,
+            ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) avgrating,
+            s.reviewcount
+        FROM leaderboards l
+        JOIN coursestats s ON s.courseid = l.courseid
+        JOIN courses c ON c.id = l.courseid
+        WHERE l.scope = ? AND l.position <= ?
+        ORDER BY l.position
+        """,
+        (scope, limit),
+    ).fetchall()
+
+
+# how many of the latest semesters the trends section shows
+TRENDSEMESTERS = int(os.environ.get("TRENDSEMESTERS", "6"))
+
+
+# reviews and averages per semester, overall and per department, read from
+# the semester rollup so the cost follows courses and terms, not reviews
+def loadtrends(con):
+    termorders = [
+        row[0]
+        for row in con.execute(
+            "SELECT DISTINCT termorder FROM semesterstats ORDER BY termorder DESC LIMIT ?",
+            (TRENDSEMESTERS,),
+        )
+    ]
+    if not termorders:
+        return [], []
+    rows = con.execute(
         """
+        SELECT
+            department,
+            termorder,
+            semester,
+            SUM(reviewcount) reviewcount,
+            SUM(ratingsum) ratingsum,
+            SUM(difficultysum) difficultysum,
+            SUM(workloadsum) workloadsum,
+            SUM(interestsum) interestsum
+        FROM semesterstats
+        WHERE termorder >= ?
+        GROUP BY department, termorder
+        ORDER BY department, termorder
+        """,
+        (min(termorders),),
     ).fetchall()
-    con.close()
 
-    # render stats page with both leaderboards
+    semesters = {}
+    departments = {}
+    for row in rows:
+        total = semesters.setdefault(row["termorder"], [row["semester"], 0, 0, 0, 0, 0])
+        sums = [
+            row["reviewcount"],
+            row["ratingsum"],
+            row["difficultysum"],
+            row["workloadsum"],
+            row["interestsum"],
+        ]
+        for position, value in enumerate(sums, start=1):
+            total[position] += value
+        departments.setdefault(row["department"], []).append(
+            trendrow(row["semester"], *sums)
+        )
+    semestertrends = [trendrow(*semesters[termorder]) for termorder in sorted(semesters)]
+    return semestertrends, sorted(departments.items())
+
+
+def trendrow(semester, reviewcount, ratingsum, difficultysum, workloadsum, interestsum):
+    return {
+        "semester": semester,
+        "reviewcount": reviewcount,
+        "overall": round(ratingsum / reviewcount, 2),
+        "difficulty": round(difficultysum / reviewcount, 2),
+        "workload": round(workloadsum / reviewcount, 2),
+        "interest": round(interestsum / reviewcount, 2),
+    }
+
+
+@app.route("/stats")
+@conditionalget
+def stats():
+    # fetch summary numbers plus top 10 by volume and rating
+    currentuser = getcurrentuser()
+    con = getconnection()
+    totals, mostreviewed, highestrated = statscache.getorcompute(
+        "leaderboards", getdataversion(), lambda: loadleaderboards(con)
+    )
+    semestertrends, departmenttrends = statscache.getorcompute(
+        "trends", getdataversion(), lambda: loadtrends(con)
+    )
+
+    # render stats page with both leaderboards and the semester trends
     return render_template(
         "stats.html",
         totals=totals,
         mostreviewed=mostreviewed,
         highestrated=highestrated,
+        semestertrends=semestertrends,
+        departmenttrends=departmenttrends,
+        currentuser=currentuser,
+    )
+
+
+# top courses by smoothed score inside one department
+@app.route("/leaderboard")
+@conditionalget
+def leaderboard():
+    currentuser = getcurrentuser()
+    con = getconnection()
+    departments = getcatalogindex(con, getdataversion()).departmentnames()
+    department = request.args.get("department", "").strip()
+    if department not in departments:
+        # unknown or missing department falls back to the first one
+        department = departments[0] if departments else ""
+    courses = loadleaderboard(con, department, rankings.LEADERBOARDSIZE) if department else []
+    return render_template(
+        "leaderboard.html",
+        departments=departments,
+        department=department,
+        courses=courses,
         currentuser=currentuser,
     )
 
 
 # course page: show one course and its reviews
 @app.route("/course/<int:courseid>", methods=["GET", "POST"])
+@conditionalget
 def coursedetail(courseid):
     # load course info first so we can 404 early
     currentuser = getcurrentuser()
-    con = openconnection()
+    con = getconnection()
     course = con.execute(
         """
         SELECT id, coursecode, coursename, department, professor, description
@@ -365,7 +1431,6 @@ def coursedetail(courseid):
 
     if course is None:
         # invalid course id path returns 404 template
-        con.close()
         return render_template(
             "coursedetail.html",
             course=None,
@@ -383,6 +1448,7 @@ def coursedetail(courseid):
         # fallback to review mode on bad mode value
         mode = "review"
     formerror = ""
+    status = 200
     formvalue = {
         "overall": "",
         "difficulty": "",
@@ -399,104 +1465,477 @@ def coursedetail(courseid):
             # fallback to review mode on bad action value
             actiontype = "review"
 
-        formvalue["overall"] = request.form.get("overall", "").strip()
-        formvalue["difficulty"] = request.form.get("difficulty", "").strip()
-        formvalue["workload"] = request.form.get("workload", "").strip()
-        formvalue["interest"] = request.form.get("interest", "").strip()
-        formvalue["reviewtext"] = request.form.get("reviewtext", "").strip()
-        formvalue["semester"] = request.form.get("semester", "").strip()
-
-        overall = None
-        difficulty = None
-        workload = None
-        interest = None
-
-        # parse all star fields as whole numbers
-        try:
-            overall = int(formvalue["overall"])
-            difficulty = int(formvalue["difficulty"])
-            workload = int(formvalue["workload"])
-            interest = int(formvalue["interest"])
-        except ValueError:
-            # leave values as none so validation below fails cleanly
-            pass
-
-        if (
-            overall is None
-            or difficulty is None
-            or workload is None
-            or interest is None
-            or overall < 1
-            or overall > 5
-            or difficulty < 1
-            or difficulty > 5
-            or workload < 1
-            or workload > 5
-            or interest < 1
-            or interest > 5
-        ):
-            # invalid star values path
-            formerror = "All rating fields must be whole numbers from 1 to 5."
-        elif actiontype == "review" and len(formvalue["reviewtext"]) < 10:
-            # review mode requires enough text content
-            formerror = "Review text must be at least 10 characters."
-        else:
-            # rating-only posts can skip text and use fallback message
-            commenttext = formvalue["reviewtext"]
-            if actiontype == "rating" and not commenttext:
-                commenttext = "Rating only submission."
-
-            con.execute(
-                """
-                INSERT INTO reviews (
-                    courseid,
-                    overallrating,
-                    difficulty,
-                    workload,
-                    interest,
-                    reviewtext,
-                    semester
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    courseid,
-                    overall,
-                    difficulty,
-                    workload,
-                    interest,
-                    commenttext,
-                    formvalue["semester"],
-                ),
-            )
-            con.commit()
-            con.close()
-            # redirect after post to prevent duplicate resubmits
-            return redirect(f"/course/{courseid}?saved=1&savetype={actiontype}")
-
-    # show newest reviews first
-    reviews = con.execute(
-        """
-        SELECT id, courseid, overallrating, difficulty, workload, interest, reviewtext, semester, dateposted
-        FROM reviews
-        WHERE courseid = ?
-        ORDER BY dateposted DESC
-        """,
+        for field in formvalue:
+            formvalue[field] = request.form.get(field, "").strip()
+
+        values, formerror = validatereview(formvalue, actiontype)
+        if values is not None:
+            try:
+                # batched with other posts, returns once that transaction commits
+                reviewwriter.submit((courseid, *values))
+            except (WriteBusy, sqlite3.Error):
+                # keep the form filled in so the user can just resubmit
+                formerror = "Could not save right now. Please try again."
+                status = 503
+            else:
+                # redirect after post to prevent duplicate resubmits
+                return redirect(f"/course/{courseid}?saved=1&savetype={actiontype}")
+
+    # show newest reviews first, one page at a time
+    reviews, nextcursor, prevcursor = fetchreviewpage(
+        con, courseid, getpagesize(REVIEWPAGESIZE)
+    )
+    reviewcount = con.execute(
+        "SELECT reviewcount FROM coursestats WHERE courseid = ?",
         (courseid,),
-    ).fetchall()
-    con.close()
+    ).fetchone()
+    pageargs = {"courseid": courseid}
+    if request.args.get("pagesize", "").strip():
+        # carry a custom page size across review pages
+        pageargs["pagesize"] = request.args.get("pagesize", "").strip()
 
     return render_template(
         "coursedetail.html",
         course=course,
         reviews=reviews,
+        reviewcount=reviewcount[0] if reviewcount else len(reviews),
+        nexturl=pageurl("coursedetail", pageargs, after=nextcursor),
+        prevurl=pageurl("coursedetail", pageargs, before=prevcursor),
         saved=saved,
         savetype=savetype,
         mode=mode,
         formerror=formerror,
         formvalue=formvalue,
         currentuser=currentuser,
+    ), status
+
+
+# rows written per transaction by the bulk import
+BULKCHUNKSIZE = int(os.environ.get("BULKCHUNKSIZE", "500"))
+# cap how many row errors one response lists, the counts stay exact
+BULKMAXERRORS = 1000
+
+
+# yield (line number, record, error) from the request body one row at a time
+def readbulkrows(stream, bulkformat):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if bulkformat == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, ""
+        return
+
+    for linenumber, line in enumerate(text, start=1):
+        if not line.strip():
+            # blank lines between records are fine
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield linenumber, None, "Line is not valid JSON."
+            continue
+        if not isinstance(record, dict):
+            yield linenumber, None, "Line must be a JSON object."
+            continue
+        yield linenumber, record, ""
+
+
+# turn one csv/ndjson record into a savereviews row using the form rules
+def parsebulkrecord(record):
+    fields = {}
+    for field in [
+        "courseid",
+        "overall",
+        "difficulty",
+        "workload",
+        "interest",
+        "reviewtext",
+        "semester",
+        "actiontype",
+    ]:
+        value = record.get(field)
+        fields[field] = "" if value is None else str(value).strip()
+
+    actiontype = fields["actiontype"] or "review"
+    if actiontype not in {"review", "rating"}:
+        return None, "actiontype must be review or rating."
+    try:
+        courseid = int(fields["courseid"])
+    except ValueError:
+        return None, "courseid must be a whole number."
+
+    values, error = validatereview(fields, actiontype)
+    if values is None:
+        return None, error
+    return (courseid, *values), ""
+
+
+def recordbulkerror(result, linenumber, error):
+    result["rejected"] += 1
+    if len(result["errors"]) < BULKMAXERRORS:
+        result["errors"].append({"line": linenumber, "error": error})
+
+
+# write one chunk in a single transaction, stats are folded once per chunk
+def flushbulkchunk(con, pending, result):
+    courseids = sorted({row[0] for linenumber, row in pending})
+    marks = ", ".join("?" for courseid in courseids)
+    known = {
+        found[0]
+        for found in con.execute(
+            f"SELECT id FROM courses WHERE id IN ({marks})", courseids
+        )
+    }
+
+    rows = []
+    for linenumber, row in pending:
+        if row[0] in known:
+            rows.append(row)
+        else:
+            recordbulkerror(result, linenumber, "Unknown courseid.")
+    if not rows:
+        return
+
+    try:
+        savereviews(con, rows)
+        con.commit()
+    except sqlite3.Error as error:
+        # a failed chunk is reported row by row, later chunks still run
+        con.rollback()
+        for linenumber, row in pending:
+            if row[0] in known:
+                recordbulkerror(result, linenumber, f"Write failed: {error}")
+        return
+    result["accepted"] += len(rows)
+    result["batches"] += 1
+
+
+# bulk import of reviews as streamed ndjson or csv, one transaction per chunk
+@app.route("/api/reviews/bulk", methods=["POST"])
+def bulkreviews():
+    currentuser = getcurrentuser()
+    if not currentuser:
+        # imports are for signed-in staff only
+        return jsonify({"error": "Login required."}), 401
+
+    bulkformat = request.args.get("format", "").strip().lower()
+    if not bulkformat:
+        # fall back to the content type, csv or anything json-lines shaped
+        bulkformat = "csv" if request.mimetype == "text/csv" else "ndjson"
+    if bulkformat not in {"csv", "ndjson"}:
+        return jsonify({"error": "format must be csv or ndjson."}), 400
+
+    con = getconnection()
+    result = {"accepted": 0, "rejected": 0, "batches": 0, "errors": []}
+    pending = []
+    status = 200
+    try:
+        for linenumber, record, error in readbulkrows(request.stream, bulkformat):
+            row = None
+            if not error:
+                row, error = parsebulkrecord(record)
+            if error:
+                # bad rows are reported, the rest of the batch keeps going
+                recordbulkerror(result, linenumber, error)
+                continue
+            pending.append((linenumber, row))
+            if len(pending) >= BULKCHUNKSIZE:
+                flushbulkchunk(con, pending, result)
+                pending = []
+    except (UnicodeDecodeError, csv.Error) as error:
+        # unreadable body, keep what was already parsed and stop there
+        result["error"] = f"Could not read request body: {error}"
+        status = 400
+
+    if pending:
+        flushbulkchunk(con, pending, result)
+    return jsonify(result), status
+
+
+# rows per read while streaming an export
+EXPORTBATCHSIZE = int(os.environ.get("EXPORTBATCHSIZE", "1000"))
+
+EXPORTQUERIES = {
+    "courses": (
+        """
+        SELECT
+            c.id,
+            c.coursecode,
+            c.coursename,
+            c.department,
+            c.professor,
+            c.level,
+            c.description,
+            COALESCE(s.reviewcount, 0) reviewcount,
+            ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) avgrating,
+            ROUND(CAST(s.difficultysum AS REAL) / s.reviewcount, 2) avgdifficulty,
+            ROUND(CAST(s.workloadsum AS REAL) / s.reviewcount, 2) avgworkload,
+            ROUND(CAST(s.interestsum AS REAL) / s.reviewcount, 2) avginterest
+        FROM courses c
+        LEFT JOIN coursestats s ON s.courseid = c.id
+        WHERE c.id > ?
+        """,
+        "c.id",
+    ),
+    "reviews": (
+        """
+        SELECT
+            r.id,
+            r.courseid,
+            c.coursecode,
+            c.department,
+            r.overallrating,
+            r.difficulty,
+            r.workload,
+            r.interest,
+            r.reviewtext,
+            r.semester,
+            r.dateposted,
+            ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) courseavgrating,
+            COALESCE(s.reviewcount, 0) coursereviewcount
+        FROM reviews r
+        JOIN courses c ON c.id = r.courseid
+        LEFT JOIN coursestats s ON s.courseid = r.courseid
+        WHERE r.id > ?
+        """,
+        "r.id",
+    ),
+}
+
+
+# accept yyyy-mm-dd or a full iso timestamp, return sqlite's datetime text
+def parsesince(sincetext):
+    try:
+        since = datetime.fromisoformat(sincetext)
+    except ValueError:
+        return None
+    if since.tzinfo is not None:
+        # dateposted is stored as utc without an offset
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# stream one export, each batch is its own short read seeking past the last id
+# so no statement or read transaction stays open between yields
+def generateexport(table, exportformat, since):
+    query, idcolumn = EXPORTQUERIES[table]
+    params = []
+    if since:
+        query += " AND r.dateposted >= ?"
+        params.append(since)
+    query += f" ORDER BY {idcolumn} LIMIT ?"
+
+    con = checkoutconnection()
+    try:
+        lastid = 0
+        wroteheader = False
+        while True:
+            cursor = con.execute(query, [lastid, *params, EXPORTBATCHSIZE])
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchmany(EXPORTBATCHSIZE)
+            buffer = io.StringIO()
+            if exportformat == "csv":
+                writer = csv.writer(buffer)
+                if not wroteheader:
+                    writer.writerow(columns)
+                    wroteheader = True
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, row))))
+                    buffer.write("\n")
+            if buffer.tell():
+                yield buffer.getvalue()
+            if len(rows) < EXPORTBATCHSIZE:
+                # short batch means we reached the end
+                break
+            lastid = rows[-1]["id"]
+    finally:
+        returnconnection(con)
+
+
+# /export/courses and /export/reviews as csv (default) or ndjson
+@app.route("/export/<table>")
+def exportdata(table):
+    if table not in EXPORTQUERIES:
+        return jsonify({"error": "Unknown export."}), 404
+    currentuser = getcurrentuser()
+    if not currentuser:
+        # exports are for signed-in staff only
+        return jsonify({"error": "Login required."}), 401
+
+    exportformat = request.args.get("format", "csv").strip().lower()
+    if exportformat not in {"csv", "ndjson"}:
+        return jsonify({"error": "format must be csv or ndjson."}), 400
+
+    since = None
+    sincetext = request.args.get("since", "").strip()
+    if sincetext:
+        if table != "reviews":
+            # only reviews carry a posting date
+            return jsonify({"error": "since only applies to reviews."}), 400
+        since = parsesince(sincetext)
+        if since is None:
+            return jsonify({"error": "since must be an ISO date."}), 400
+
+    mimetype = "text/csv" if exportformat == "csv" else "application/x-ndjson"
+    response = app.response_class(
+        generateexport(table, exportformat, since), mimetype=mimetype
+    )
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename={table}.{exportformat}"
+    )
+    return response
+
+
+# suggestions returned per keystroke unless ?limit= asks for fewer or more
+SUGGESTLIMIT = int(os.environ.get("SUGGESTLIMIT", "8"))
+MAXSUGGESTLIMIT = 20
+
+
+# typeahead for the home search box, answered from memory without touching the catalog
+@app.route("/api/suggest")
+def suggestcourses():
+    query = request.args.get("q", "").strip()[:100]
+    try:
+        limit = int(request.args.get("limit", SUGGESTLIMIT))
+    except ValueError:
+        limit = SUGGESTLIMIT
+    limit = max(1, min(limit, MAXSUGGESTLIMIT))
+
+    index = getsuggestindex(getconnection(), getdataversion())
+    response = jsonify({"query": query, "suggestions": index.suggest(query, limit)})
+    # counts only move on writes, a short shared cache absorbs repeat keystrokes
+    response.cache_control.public = True
+    response.cache_control.max_age = 30
+    return response
+
+
+# every course with short keys for the spa to filter locally:
+# i id, c code, t title, d department index, p professor, l level,
+# n review count, r rating, x difficulty, w workload, e interest (averages left out when unreviewed)
+def buildcatalogbundle(con, dataversion):
+    rows = con.execute(
+        """
+        SELECT
+            c.id,
+            c.coursecode,
+            c.coursename,
+            c.department,
+            c.professor,
+            c.level,
+            COALESCE(s.reviewcount, 0) reviewcount,
+            ROUND(CAST(s.ratingsum AS REAL) / s.reviewcount, 2) avgrating,
+            ROUND(CAST(s.difficultysum AS REAL) / s.reviewcount, 2) avgdifficulty,
+            ROUND(CAST(s.workloadsum AS REAL) / s.reviewcount, 2) avgworkload,
+            ROUND(CAST(s.interestsum AS REAL) / s.reviewcount, 2) avginterest
+        FROM courses c
+        LEFT JOIN coursestats s ON s.courseid = c.id
+        ORDER BY c.coursecode, c.id
+        """
+    ).fetchall()
+
+    departments = sorted({row["department"] for row in rows})
+    departmentindex = {name: index for index, name in enumerate(departments)}
+    courses = []
+    for row in rows:
+        course = {
+            "i": row["id"],
+            "c": row["coursecode"],
+            "t": row["coursename"],
+            "d": departmentindex[row["department"]],
+            "p": row["professor"],
+            "l": row["level"],
+            "n": row["reviewcount"],
+        }
+        if row["reviewcount"]:
+            course["r"] = row["avgrating"]
+            course["x"] = row["avgdifficulty"]
+            course["w"] = row["avgworkload"]
+            course["e"] = row["avginterest"]
+        courses.append(course)
+
+    body = json.dumps(
+        {"v": dataversion, "d": departments, "c": courses}, separators=(",", ":")
+    ).encode("utf-8")
+    # mtime=0 keeps the bytes, and so the hash, identical across workers
+    return {
+        "hash": hashlib.sha256(body).hexdigest()[:16],
+        "gzipped": gzip.compress(body, compresslevel=9, mtime=0),
+        "size": len(body),
+    }
+
+
+def getcatalogbundle():
+    dataversion = getdataversion()
+    return catalogcache.getorcompute(
+        "bundle",
+        dataversion,
+        lambda: buildcatalogbundle(getconnection(), dataversion),
+    )
+
+
+# entry point the spa fetches, cheap redirect to the current content hash
+@app.route("/api/catalog")
+def catalog():
+    bundle = getcatalogbundle()
+    response = redirect(url_for("catalogbundle", bundlehash=bundle["hash"]))
+    response.cache_control.no_cache = True
+    return response
+
+
+# hashed bundle never changes, so browsers and cdns may keep it forever
+@app.route("/api/catalog/<bundlehash>.json")
+def catalogbundle(bundlehash):
+    bundle = getcatalogbundle()
+    if bundlehash != bundle["hash"]:
+        # stale hash from an older data version, client should refetch /api/catalog
+        return jsonify({"error": "Catalog version is gone."}), 404
+
+    if "gzip" in request.accept_encodings:
+        response = app.response_class(bundle["gzipped"], mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = app.response_class(
+            gzip.decompress(bundle["gzipped"]), mimetype="application/json"
+        )
+    response.vary.add("Accept-Encoding")
+    response.set_etag(bundle["hash"])
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+# brotli first, then gzip, then the plain file, matched against accept-encoding
+ASSETENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+# hashed bundles from buildassets.py, precompressed and cached for a year
+# the name changes with the content, so clients never need to revalidate
+@app.route("/static/assets/<name>")
+def staticasset(name):
+    if name not in assetfiles or name == "manifest.json":
+        return "Not found", 404
+    filename = name
+    encoding = None
+    for candidate, suffix in ASSETENCODINGS:
+        if candidate in request.accept_encodings and name + suffix in assetfiles:
+            filename = name + suffix
+            encoding = candidate
+            break
+
+    response = send_from_directory(
+        buildassets.ASSETDIR,
+        filename,
+        mimetype=mimetypes.guess_type(name)[0],
+        max_age=31536000,
     )
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+# small in-process cache with ttl + lru eviction
+# entries are tied to the db data version, so any committed review write
+# (which bumps the version) drops everything on the next lookup in each worker
+class VersionedCache:
+    def __init__(self, name, maxsize=128, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # drop every entry when the data version moved since we last looked
+    def syncversion(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    # return (found, value) so cached none values still count as hits
+    def lookup(self, key, version):
+        with self.lock:
+            self.syncversion(version)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                # fresh hit, mark as most recently used
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                # expired entry is removed on touch
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def store(self, key, value, version):
+        with self.lock:
+            self.syncversion(version)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                # evict least recently used
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # get a value or compute and store it on miss
+    def getorcompute(self, key, version, compute):
+        found, value = self.lookup(key, version)
+        if found:
+            return value
+        value = compute()
+        self.store(key, value, version)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitrate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1 @@
+# synthetic-data load tests for app.py, see python -m benchmark run --help
@@ -0,0 +1,81 @@
+# run from the repo root: python -m benchmark run
+import argparse
+import os
+import tempfile
+import time
+
+from benchmark.runner import compareresults, runbenchmark, saveresult
+from benchmark.synthetic import builddataset
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="Synthetic load test for the course review app.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    run = subparsers.add_parser("run", help="build a dataset and measure every route")
+    run.add_argument("--courses", type=int, default=2000)
+    run.add_argument("--reviews", type=int, default=50000)
+    run.add_argument("--requests", type=int, default=2000)
+    run.add_argument("--threads", type=int, default=4)
+    run.add_argument("--seed", type=int, default=550)
+    run.add_argument("--skew", type=float, default=1.1)
+    run.add_argument("--login-weight", type=float, default=0.02)
+    run.add_argument("--dbpath", default="")
+    run.add_argument("--output", default="")
+
+    compare = subparsers.add_parser("compare", help="diff two saved result files")
+    compare.add_argument("base")
+    compare.add_argument("head")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compareresults(args.base, args.head)
+        return
+    if args.command != "run":
+        parser.print_help()
+        return
+
+    dbpath = args.dbpath or os.path.join(tempfile.gettempdir(), "coursebenchmark.db")
+    print(f"Building {args.courses} courses / {args.reviews} reviews in {dbpath}")
+    courseids, loadstats = builddataset(
+        dbpath, args.courses, args.reviews, seed=args.seed, skew=args.skew
+    )
+    print(f"Catalog loaded at {loadstats['rowspersecond']:.0f} rows/sec")
+
+    # rough traffic mix, login is rare but expensive
+    weights = {
+        "home": 0.5,
+        "coursedetail": 0.35,
+        "stats": 0.15 - args.login_weight,
+        "login": args.login_weight,
+    }
+    result = runbenchmark(
+        dbpath, courseids, args.requests, args.threads, weights, seed=args.seed
+    )
+    result["dataset"] = {
+        "courses": args.courses,
+        "reviews": args.reviews,
+        "seed": args.seed,
+        "skew": args.skew,
+    }
+
+    for route, numbers in result["routes"].items():
+        print(
+            f"{route:<14} n={numbers['requests']:<6} p50={numbers['p50ms']:.2f}ms "
+            f"p95={numbers['p95ms']:.2f}ms p99={numbers['p99ms']:.2f}ms "
+            f"q/req={numbers['queriesperrequest']} rps={numbers['throughput']}"
+        )
+    print(f"total throughput {result['throughput']} req/s over {result['wallseconds']}s")
+
+    output = args.output or os.path.join(
+        "benchmark", "results", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    saveresult(result, output)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
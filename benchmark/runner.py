@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import random
+import sqlite3
+import threading
+import time
+
+import initdb
+import metrics
+
+
+# statements seen on the current thread, reset before each request
+querycounter = threading.local()
+
+
+# only count statements the app issued, same filter as the /metrics counts
+def countquery(statement):
+    if metrics.isappstatement(statement):
+        querycounter.count = getattr(querycounter, "count", 0) + 1
+
+
+def tracehook(con):
+    con.set_trace_callback(countquery)
+
+
+# nearest-rank percentile over an already sorted list
+def percentile(sortedvalues, fraction):
+    if not sortedvalues:
+        return None
+    index = max(0, int(round(fraction * len(sortedvalues) + 0.5)) - 1)
+    return sortedvalues[min(index, len(sortedvalues) - 1)]
+
+
+# pick the next request for a worker, weighted toward browsing like real traffic
+def pickrequest(rng, courseids, departments, weights):
+    route = rng.choices(list(weights), weights=list(weights.values()))[0]
+    if route == "home":
+        variant = rng.randint(0, 4)
+        if variant == 0:
+            return route, "GET", "/", None
+        if variant == 1:
+            return route, "GET", f"/?department={rng.choice(departments)}", None
+        if variant == 2:
+            return route, "GET", f"/?search={rng.choice(['adv', 'history', 'theory'])}", None
+        if variant == 3:
+            return route, "GET", "/?minrating=4", None
+        return route, "GET", f"/?level={rng.randint(1, 6)}00", None
+    if route == "stats":
+        return route, "GET", "/stats", None
+    if route == "coursedetail":
+        # popular courses are requested more, same skew as the reviews
+        index = min(int(rng.paretovariate(1.2)) - 1, len(courseids) - 1)
+        return route, "GET", f"/course/{courseids[index]}", None
+    return (
+        route,
+        "POST",
+        "/login",
+        {"username": "benchmark", "password": "benchmark-password"},
+    )
+
+
+# one worker thread with its own test client, returns timing samples
+def runworker(flaskapp, workerid, requestcount, courseids, departments, weights, seed):
+    rng = random.Random(seed + workerid)
+    samples = []
+    for index in range(requestcount):
+        route, method, path, form = pickrequest(rng, courseids, departments, weights)
+        # fresh client per request so no session leaks between samples
+        client = flaskapp.test_client()
+        querycounter.count = 0
+        started = time.perf_counter()
+        if method == "POST":
+            response = client.post(path, data=form)
+        else:
+            response = client.get(path)
+        elapsed = time.perf_counter() - started
+        samples.append((route, elapsed, querycounter.count, response.status_code))
+    return samples
+
+
+# summarize raw samples into per-route latency, query, and throughput numbers
+def summarize(samples, wallseconds):
+    routes = {}
+    for route, elapsed, queries, status in samples:
+        entry = routes.setdefault(route, {"latencies": [], "queries": 0, "errors": 0})
+        entry["latencies"].append(elapsed * 1000)
+        entry["queries"] += queries
+        if status >= 400:
+            entry["errors"] += 1
+
+    summary = {}
+    for route, entry in sorted(routes.items()):
+        latencies = sorted(entry["latencies"])
+        count = len(latencies)
+        summary[route] = {
+            "requests": count,
+            "errors": entry["errors"],
+            "p50ms": round(percentile(latencies, 0.50), 3),
+            "p95ms": round(percentile(latencies, 0.95), 3),
+            "p99ms": round(percentile(latencies, 0.99), 3),
+            "meanms": round(sum(latencies) / count, 3),
+            "queriesperrequest": round(entry["queries"] / count, 2),
+            "throughput": round(count / wallseconds, 2),
+        }
+    return summary
+
+
+# drive the app against dbpath and return a json-ready result
+def runbenchmark(
+    dbpath, courseids, requestcount, threads, weights, seed=550, warmup=50
+):
+    # login throttles would turn a benchmark into a 429 test, relax them
+    os.environ["COURSEDBPATH"] = dbpath
+    os.environ.setdefault("LOGINUSERLIMIT", "1000000000")
+    os.environ.setdefault("LOGINIPLIMIT", "1000000000")
+    os.environ.setdefault("LOGINQUEUE", str(threads * 2))
+    import app
+
+    if tracehook not in app.connectionhooks:
+        app.connectionhooks.append(tracehook)
+
+    con = sqlite3.connect(dbpath)
+    initdb.attachcatalog(con, dbpath)
+    departments = [row[0] for row in con.execute("SELECT DISTINCT department FROM courses")]
+    con.close()
+
+    # warm pools and caches so the first samples are not all cold misses
+    runworker(app.app, -1, warmup, courseids, departments, weights, seed)
+
+    perworker = max(1, requestcount // threads)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(
+                runworker,
+                app.app,
+                workerid,
+                perworker,
+                courseids,
+                departments,
+                weights,
+                seed,
+            )
+            for workerid in range(threads)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    wallseconds = time.perf_counter() - started
+
+    return {
+        "startedat": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "threads": threads,
+        "requests": len(samples),
+        "wallseconds": round(wallseconds, 3),
+        "throughput": round(len(samples) / wallseconds, 2),
+        "routes": summarize(samples, wallseconds),
+    }
+
+
+def saveresult(result, outputpath):
+    outputdir = os.path.dirname(outputpath)
+    if outputdir:
+        os.makedirs(outputdir, exist_ok=True)
+    with open(outputpath, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2, sort_keys=True)
+
+
+# print per-route p95 and throughput changes between two saved runs
+def compareresults(basepath, headpath):
+    with open(basepath, encoding="utf-8") as file:
+        base = json.load(file)
+    with open(headpath, encoding="utf-8") as file:
+        head = json.load(file)
+
+    print(f"{'route':<14}{'p95 base':>10}{'p95 head':>10}{'change':>9}{'rps base':>10}{'rps head':>10}")
+    for route in sorted(set(base["routes"]) | set(head["routes"])):
+        before = base["routes"].get(route)
+        after = head["routes"].get(route)
+        if before is None or after is None:
+            print(f"{route:<14} only in {'head' if before is None else 'base'}")
+            continue
+        change = (after["p95ms"] - before["p95ms"]) / before["p95ms"] * 100
+        print(
+            f"{route:<14}{before['p95ms']:>10.2f}{after['p95ms']:>10.2f}{change:>8.1f}%"
+            f"{before['throughput']:>10.1f}{after['throughput']:>10.1f}"
+        )
@@ -0,0 +1,129 @@
+import csv
+import os
+import random
+import sqlite3
+
+import initdb
+
+
+SEMESTERS = ["Fall 2024", "Winter 2025", "Spring 2025", "Fall 2025", "Winter 2026"]
+WORDS = [
+    "advanced",
+    "applied",
+    "foundations",
+    "seminar",
+    "studies",
+    "topics",
+    "introduction",
+    "honors",
+    "workshop",
+    "methods",
+    "history",
+    "theory",
+    "practice",
+    "analysis",
+    "writing",
+    "design",
+]
+
+
+# department prefixes the app already knows how to label
+def departmentprefixes():
+    prefixes = []
+    for first in range(ord("A"), ord("Z") + 1):
+        for second in range(ord("A"), ord("Z") + 1):
+            prefix = chr(first) + chr(second)
+            if initdb.departmentfromcode(prefix) != "General":
+                prefixes.append(prefix)
+    return prefixes
+
+
+# write a catalog csv in the same column layout as the real export
+def writecatalogcsv(csvpath, coursecount, rng):
+    prefixes = departmentprefixes()
+    with open(csvpath, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["course_code", "title", "full_description", "section_blurb"])
+        for index in range(coursecount):
+            prefix = prefixes[index % len(prefixes)]
+            level = rng.randint(1, 6)
+            coursecode = f"{prefix}{level}{index:05d}"
+            title = " ".join(rng.sample(WORDS, 3)).upper()
+            description = " ".join(rng.choices(WORDS, k=40)).capitalize() + "."
+            writer.writerow([coursecode, title, description, ""])
+
+
+# zipf-like weights so a few courses get most of the reviews
+def popularityweights(coursecount, skew):
+    return [1 / (rank**skew) for rank in range(1, coursecount + 1)]
+
+
+# build a deterministic db at dbpath through the normal initdb schema and loader
+# returns course ids ordered from most to least popular
+def builddataset(dbpath, coursecount, reviewcount, seed=550, skew=1.1):
+    rng = random.Random(seed)
+    # --dbpath may point into a folder that does not exist yet
+    os.makedirs(os.path.dirname(dbpath) or ".", exist_ok=True)
+    for path in [dbpath, dbpath + "-wal", dbpath + "-shm", initdb.catalogpathfor(dbpath)]:
+        if os.path.exists(path):
+            # always start from empty files so runs are comparable
+            os.remove(path)
+
+    con = sqlite3.connect(dbpath)
+    initdb.migratedatabase(con)
+
+    csvpath = dbpath + ".csv"
+    writecatalogcsv(csvpath, coursecount, rng)
+    loadstats = initdb.publishcatalog(
+        dbpath, lambda catcon: initdb.loadcatalog(catcon, csvpath)
+    )
+    os.remove(csvpath)
+    initdb.attachcatalog(con, dbpath)
+
+    courseids = [row[0] for row in con.execute("SELECT id FROM courses ORDER BY id")]
+    # shuffle so popularity is not tied to department or code order
+    rng.shuffle(courseids)
+    weights = popularityweights(len(courseids), skew)
+
+    batch = []
+    for courseid in rng.choices(courseids, weights=weights, k=reviewcount):
+        overall = rng.randint(1, 5)
+        batch.append(
+            (
+                courseid,
+                overall,
+                rng.randint(1, 5),
+                rng.randint(1, 5),
+                max(1, min(5, overall + rng.randint(-1, 1))),
+                "Synthetic benchmark review with enough text to look real.",
+                rng.choice(SEMESTERS),
+            )
+        )
+        if len(batch) >= 10000:
+            insertreviews(con, batch)
+            batch = []
+    if batch:
+        insertreviews(con, batch)
+
+    con.execute(
+        "INSERT OR IGNORE INTO users (username, passwordhash) VALUES (?, ?)",
+        ("benchmark", initdb.hashpassword("benchmark-password")),
+    )
+    initdb.rebuildcoursestats(con)
+    initdb.rebuildsemesterstats(con)
+    initdb.bumpdataversion(con)
+    con.commit()
+    con.execute("ANALYZE main")
+    con.close()
+    return courseids, loadstats
+
+
+def insertreviews(con, batch):
+    con.executemany(
+        """
+        INSERT INTO reviews (courseid, overallrating, difficulty, workload, interest, reviewtext, semester)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        batch,
+    )
+    con.commit()
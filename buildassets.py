@@ -0,0 +1,174 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+from urllib.request import urlopen
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, without it only .gz variants get written
+    brotli = None
+
+
+# build step for static files: vendor bootstrap, bundle and minify it with our
+# own css and js, then write content-hashed files plus .gz and .br variants
+# app.py reads the manifest so url_for("static", filename="site.css") points
+# at the current hashed file
+
+STATICDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSETDIR = os.path.join(STATICDIR, "assets")
+MANIFESTPATH = os.path.join(ASSETDIR, "manifest.json")
+
+# pinned bootstrap files with the sha384 digests bootstrap publishes for them,
+# fetched once into static/vendor and checked before anything is written or built
+BOOTSTRAPVERSION = "5.3.0"
+BOOTSTRAPURL = f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAPVERSION}/dist"
+VENDORFILES = {
+    "vendor/bootstrap.min.css": (
+        f"{BOOTSTRAPURL}/css/bootstrap.min.css",
+        "9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM",
+    ),
+    "vendor/bootstrap.bundle.min.js": (
+        f"{BOOTSTRAPURL}/js/bootstrap.bundle.min.js",
+        "geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz",
+    ),
+}
+
+
+# google fonts stay external: the css2 stylesheet is generated per browser and
+# its gstatic urls move with font releases, so there are no fixed bytes to pin
+# here, and the woff2 files are already served with a one year immutable cache
+
+# bundle name -> source files under static, joined in this order
+ASSETBUNDLES = {
+    "site.css": ["vendor/bootstrap.min.css", "style.css"],
+    "site.js": ["vendor/bootstrap.bundle.min.js", "suggest.js"],
+}
+
+# quoted strings and /*! license banners are copied through untouched
+KEEPPATTERN = r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|/\*!.*?\*/"
+# one left to right scan, so quotes inside comments and comment markers inside
+# strings are each seen as part of whatever token they sit in
+CSSTOKENS = re.compile(rf"({KEEPPATTERN})|/\*.*?\*/", re.S)
+KEEPTOKENS = re.compile(rf"({KEEPPATTERN})", re.S)
+
+
+def sri(body):
+    return base64.b64encode(hashlib.sha384(body).digest()).decode("ascii")
+
+
+def fetchvendorfiles(refresh=False):
+    for name, (url, digest) in VENDORFILES.items():
+        path = os.path.join(STATICDIR, name)
+        if os.path.exists(path) and not refresh:
+            with open(path, "rb") as file:
+                body = file.read()
+            if sri(body) != digest:
+                raise SystemExit(
+                    f"static/{name} does not match its pinned sha384, rerun with --refresh"
+                )
+            continue
+        with urlopen(url, timeout=30) as response:
+            body = response.read()
+        if sri(body) != digest:
+            # never vendor bytes we did not pin
+            raise SystemExit(f"{url} does not match its pinned sha384")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+        print(f"Vendored {url} -> static/{name}")
+
+
+# drop comments, except /*! license banners, and collapse whitespace
+def minifycss(text):
+    text = CSSTOKENS.sub(lambda match: match.group(1) or "", text)
+    pieces = KEEPTOKENS.split(text)
+    for index in range(0, len(pieces), 2):
+        piece = re.sub(r"\s+", " ", pieces[index])
+        # spaces next to these never change meaning, a space before : can
+        # in selectors like ".card :hover", so only the one after it goes
+        piece = re.sub(r" ?([{};,>]) ?", r"\1", piece)
+        piece = piece.replace(": ", ":")
+        pieces[index] = piece.replace(";}", "}")
+    return "".join(pieces).strip()
+
+
+# line based and conservative: newlines stay so automatic semicolons still work
+def minifyjs(text):
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("//"):
+            # blank lines, comment lines, and source map links
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def buildbundle(name, sources):
+    minify = minifycss if name.endswith(".css") else minifyjs
+    parts = []
+    for source in sources:
+        with open(os.path.join(STATICDIR, source), "r", encoding="utf-8") as file:
+            parts.append(minify(file.read()))
+    # js files may end without a semicolon, a newline keeps them apart
+    return ("\n".join(parts) + "\n").encode("utf-8")
+
+
+# write name.<hash>.ext plus compressed copies, returns the hashed name
+def writeasset(name, body):
+    root, extension = os.path.splitext(name)
+    hashedname = f"{root}.{hashlib.sha256(body).hexdigest()[:12]}{extension}"
+    path = os.path.join(ASSETDIR, hashedname)
+    with open(path, "wb") as file:
+        file.write(body)
+    # mtime 0 keeps the gzip bytes identical across builds of the same input
+    with open(path + ".gz", "wb") as file:
+        file.write(gzip.compress(body, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as file:
+            file.write(brotli.compress(body, quality=11))
+    return hashedname
+
+
+def buildassets(refresh=False):
+    fetchvendorfiles(refresh)
+    os.makedirs(ASSETDIR, exist_ok=True)
+    manifest = {}
+    for name, sources in ASSETBUNDLES.items():
+        body = buildbundle(name, sources)
+        manifest[name] = writeasset(name, body)
+        print(f"Built static/assets/{manifest[name]} ({len(body)} bytes)")
+
+    # written after the bundles so the manifest never names a missing file
+    temppath = MANIFESTPATH + ".tmp"
+    with open(temppath, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temppath, MANIFESTPATH)
+
+    # older builds are no longer referenced by the manifest
+    keep = {"manifest.json"}
+    for hashedname in manifest.values():
+        keep.update([hashedname, hashedname + ".gz", hashedname + ".br"])
+    for leftover in os.listdir(ASSETDIR):
+        if leftover not in keep:
+            os.remove(os.path.join(ASSETDIR, leftover))
+    if brotli is None:
+        print("brotli not installed, skipped .br variants")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python buildassets.py",
+        description="Vendor bootstrap and build hashed, precompressed static bundles.",
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", help="download the vendored files again"
+    )
+    args = parser.parse_args()
+    buildassets(args.refresh)
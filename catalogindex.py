@@ -0,0 +1,122 @@
+# per-worker in-memory index over the course catalog
+# each course gets a bit position in (department, coursecode, id) order, and every
+# facet value keeps a python int bitset of its courses, so a filter is a few ands
+# and a facet count is one popcount
+
+
+# one course, slots keep thousands of these small
+class CourseRecord:
+    __slots__ = ("id", "department", "coursecode", "level", "ratingsum", "reviewcount")
+
+    def __init__(self, courseid, department, coursecode, level, ratingsum, reviewcount):
+        self.id = courseid
+        self.department = department
+        self.coursecode = coursecode
+        self.level = level
+        self.ratingsum = ratingsum
+        self.reviewcount = reviewcount
+
+    # same key the home page sorts and pages by
+    def sortkey(self):
+        return (self.department, self.coursecode, self.id)
+
+
+def bitsfrompositions(positions, size):
+    bitmap = bytearray((size + 7) // 8)
+    for position in positions:
+        bitmap[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+# set bit positions in ascending order
+def positionsof(bits):
+    text = bin(bits)[:1:-1]
+    positions = []
+    position = text.find("1")
+    while position != -1:
+        positions.append(position)
+        position = text.find("1", position + 1)
+    return positions
+
+
+class CatalogIndex:
+    # rows carry (id, department, coursecode, level, ratingsum, reviewcount)
+    def __init__(self, rows):
+        self.records = [CourseRecord(*row) for row in rows]
+        self.records.sort(key=CourseRecord.sortkey)
+        self.size = len(self.records)
+        self.allbits = (1 << self.size) - 1
+        self.positions = {record.id: position for position, record in enumerate(self.records)}
+
+        departments = {}
+        levels = {}
+        # bucket n holds averages in [n, n + 1), unreviewed courses sit in none
+        buckets = [[] for bucket in range(6)]
+        for position, record in enumerate(self.records):
+            departments.setdefault(record.department, []).append(position)
+            if record.level is not None:
+                levels.setdefault(record.level, []).append(position)
+            if record.reviewcount:
+                buckets[int(record.ratingsum / record.reviewcount)].append(position)
+
+        self.departments = {
+            name: bitsfrompositions(positions, self.size)
+            for name, positions in departments.items()
+        }
+        self.levels = {
+            level: bitsfrompositions(positions, self.size)
+            for level, positions in levels.items()
+        }
+        self.ratingbuckets = [bitsfrompositions(positions, self.size) for positions in buckets]
+
+    def departmentnames(self):
+        return sorted(self.departments)
+
+    def levelvalues(self):
+        return sorted(self.levels)
+
+    def bitsforids(self, courseids):
+        positions = [self.positions[courseid] for courseid in courseids if courseid in self.positions]
+        return bitsfrompositions(positions, self.size)
+
+    # courses whose exact average is at least minrating, like the sql filter did
+    def ratingbits(self, minrating):
+        bits = 0
+        for bucket, bucketbits in enumerate(self.ratingbuckets):
+            if bucket >= minrating:
+                bits |= bucketbits
+            elif bucket + 1 > minrating and bucketbits:
+                # boundary bucket, only some of its courses clear the bar
+                passing = [
+                    position
+                    for position in positionsof(bucketbits)
+                    if self.records[position].ratingsum
+                    >= minrating * self.records[position].reviewcount
+                ]
+                bits |= bitsfrompositions(passing, self.size)
+        return bits
+
+    # filter in one pass, returns (matching bits, department counts, level counts)
+    # each facet count applies every other active filter, so the number next to an
+    # option is what picking it would return
+    def query(self, department, level, minrating, searchbits=None):
+        departmentbits = self.departments.get(department, 0) if department else self.allbits
+        levelbits = self.levels.get(level, 0) if level else self.allbits
+        otherbits = self.allbits
+        if minrating is not None:
+            otherbits &= self.ratingbits(minrating)
+        if searchbits is not None:
+            otherbits &= searchbits
+
+        departmentcounts = {
+            name: (bits & levelbits & otherbits).bit_count()
+            for name, bits in self.departments.items()
+        }
+        levelcounts = {
+            value: (bits & departmentbits & otherbits).bit_count()
+            for value, bits in self.levels.items()
+        }
+        return departmentbits & levelbits & otherbits, departmentcounts, levelcounts
+
+    def recordsfor(self, bits):
+        return [self.records[position] for position in positionsof(bits)]
@@ -0,0 +1,9 @@
+import os
+
+
+# threaded workers, so one worker holds several requests at once; with sync
+# workers the login verify pool never sees more than one attempt and cannot
+# turn overflow away with a fast 503, keep threads above LOGINWORKERS + LOGINQUEUE
+# the review writer also needs concurrent posts in one worker to batch them
+worker_class = "gthread"
+threads = int(os.environ.get("WEBTHREADS", "8"))
@@ -1,8 +1,14 @@
 import csv
 import os
 import sqlite3
+import sys
+import time
 from hashlib import pbkdf2_hmac
 from secrets import token_hex
+from urllib.request import pathname2url
+
+import rankings
+import semesterstats
 
 
 # map course code prefix to a department label
@@ -56,19 +62,185 @@ def hashpassword(password):
     return f"pbkdf2sha256${iterations}${salt}${digest}"
 
 
-# create tables and seed starter data if db is empty
-def builddatabase():
+# open the configured db file, creating its folder when needed
+def opendatabase():
     dbpath = os.environ.get("COURSEDBPATH", "courses.db")
     dbdir = os.path.dirname(dbpath)
     if dbdir:
         # create folder only when db path includes directories
         os.makedirs(dbdir, exist_ok=True)
+    return dbpath, sqlite3.connect(dbpath)
+
+
+# the static catalog lives in its own file beside the reviews db, e.g. coursescatalog.db
+def catalogpathfor(dbpath):
+    override = os.environ.get("COURSECATALOGDBPATH", "")
+    if override:
+        return override
+    root, extension = os.path.splitext(dbpath)
+    return f"{root}catalog{extension or '.db'}"
+
+
+# make courses and coursesearch resolve to the published catalog on this connection
+# attach is not allowed inside a transaction, so callers commit first
+def attachcatalog(con, dbpath):
+    con.execute("ATTACH DATABASE ? AS catalog", (catalogpathfor(dbpath),))
+
+
+# recompute per-course rating sums from scratch out of the reviews table
+def rebuildcoursestats(con):
+    columns = [row[1] for row in con.execute("PRAGMA table_info(coursestats)")]
+    nextversion = None
+    if "version" in columns:
+        # every course moves past its old version so cached cards re-render
+        nextversion = con.execute(
+            "SELECT COALESCE(MAX(version), 0) + 1 FROM coursestats"
+        ).fetchone()[0]
+    con.execute("DELETE FROM coursestats")
+    con.execute(
+        """
+        INSERT INTO coursestats (
+            courseid,
+            reviewcount,
+            ratingsum,
+            difficultysum,
+            workloadsum,
+            interestsum
+        )
+        SELECT
+            c.id,
+            COUNT(r.id),
+            COALESCE(SUM(r.overallrating), 0),
+            COALESCE(SUM(r.difficulty), 0),
+            COALESCE(SUM(r.workload), 0),
+            COALESCE(SUM(r.interest), 0)
+        FROM courses c
+        LEFT JOIN reviews r ON r.courseid = c.id
+        GROUP BY c.id
+        """
+    )
+    if nextversion is not None:
+        con.execute("UPDATE coursestats SET version = ?", (nextversion,))
+    if "score" in columns:
+        # the fresh rows have no department or score yet
+        rebuildrankings(con)
+    return con.execute("SELECT COUNT(*) FROM coursestats").fetchone()[0]
+
+
+# course id -> department out of the published catalog file, read on its own
+# connection so this also works inside a migration where attach is not allowed
+def catalogdepartments(con):
+    dbpath = con.execute("PRAGMA database_list").fetchone()[2]
+    catalogpath = catalogpathfor(dbpath)
+    if not os.path.exists(catalogpath):
+        return {}
+    catcon = sqlite3.connect(
+        f"file:{pathname2url(os.path.abspath(catalogpath))}?mode=ro", uri=True
+    )
+    try:
+        return dict(catcon.execute("SELECT id, department FROM courses").fetchall())
+    finally:
+        catcon.close()
+
+
+# recompute the semester rollup from scratch out of the reviews table
+def rebuildsemesterstats(con):
+    departments = catalogdepartments(con)
+    con.execute("DELETE FROM semesterstats")
+    reviews = con.execute(
+        """
+        SELECT courseid, overallrating, difficulty, workload, interest, semester, dateposted
+        FROM reviews
+        """
+    )
+    rollup = semesterstats.foldreviews(reviews, departments)
+    semesterstats.addsemesterstats(con, rollup)
+    return len(rollup)
+
+
+# phantom reviews at the site-wide mean that every course score starts from
+PRIORWEIGHT = float(os.environ.get("RANKPRIORWEIGHT", "5"))
 
-    con = sqlite3.connect(dbpath)
-    cur = con.cursor()
 
+# re-derive the prior from all reviews, rescore every course, and rewrite
+# every leaderboard; between rebuilds the app keeps this prior fixed so a
+# review only moves the score of its own course
+def rebuildrankings(con):
+    priormean = con.execute(
+        "SELECT COALESCE(CAST(SUM(ratingsum) AS REAL) / SUM(reviewcount), 3.0) FROM coursestats"
+    ).fetchone()[0]
+    con.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [("priormean", priormean), ("priorweight", PRIORWEIGHT)],
+    )
+    departments = catalogdepartments(con)
+    rankings.setdepartments(con, departments)
+    rankings.rescorecourses(con)
+    con.execute("DELETE FROM leaderboards")
+    rankings.refreshleaderboards(con, departments.values())
+
+
+# full text index over the course catalog, kept in sync by triggers
+# returns False when this sqlite build has no fts5 so the app falls back to LIKE
+def buildsearchindex(con):
+    existing = con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'coursesearch'"
+    ).fetchone()
+    try:
+        con.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS coursesearch USING fts5(
+                coursecode,
+                coursename,
+                professor,
+                description,
+                content = 'courses',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # sqlite compiled without fts5
+        return False
+
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS coursesearchinsert AFTER INSERT ON courses BEGIN
+            INSERT INTO coursesearch (rowid, coursecode, coursename, professor, description)
+            VALUES (new.id, new.coursecode, new.coursename, new.professor, new.description);
+        END
+        """
+    )
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS coursesearchdelete AFTER DELETE ON courses BEGIN
+            INSERT INTO coursesearch (coursesearch, rowid, coursecode, coursename, professor, description)
+            VALUES ('delete', old.id, old.coursecode, old.coursename, old.professor, old.description);
+        END
+        """
+    )
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS coursesearchupdate AFTER UPDATE ON courses BEGIN
+            INSERT INTO coursesearch (coursesearch, rowid, coursecode, coursename, professor, description)
+            VALUES ('delete', old.id, old.coursecode, old.coursename, old.professor, old.description);
+            INSERT INTO coursesearch (rowid, coursecode, coursename, professor, description)
+            VALUES (new.id, new.coursecode, new.coursename, new.professor, new.description);
+        END
+        """
+    )
+    if existing is None:
+        # first run on an older db: index the courses already loaded
+        con.execute("INSERT INTO coursesearch (coursesearch) VALUES ('rebuild')")
+    return True
+
+
+# version 1: core tables the app was first deployed with
+def migration1(con):
     # users table stores login credentials
-    cur.execute(
+    con.execute(
         """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -79,7 +251,7 @@ def builddatabase():
     )
 
     # courses table stores class metadata
-    cur.execute(
+    con.execute(
         """
         CREATE TABLE IF NOT EXISTS courses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -93,7 +265,7 @@ def builddatabase():
     )
 
     # reviews table stores user ratings and comments
-    cur.execute(
+    con.execute(
         """
         CREATE TABLE IF NOT EXISTS reviews (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -110,82 +282,568 @@ def builddatabase():
         """
     )
 
-    professorpool = [
-        "Dr. Thompson",
-        "Ms. Rodriguez",
-        "Mr. Chen",
-        "Dr. Martinez",
-        "Prof. Blake",
-        "Dr. Harrison",
-        "Ms. Williams",
-        "Mr. Johnson",
-        "Dr. Anderson",
-        "Ms. Lee",
-        "Prof. Kumar",
-        "Dr. Zhang",
-        "Mr. Brown",
-        "Dr. Green",
-        "Ms. Clark",
-        "Prof. Walker",
-        "Dr. Adams",
-        "Ms. Rivera",
-        "Mr. Collins",
-        "Dr. Foster",
-        "Prof. Bennett",
-        "Dr. Patel",
-        "Ms. Singh",
-        "Mr. Davis",
-        "Dr. Wilson",
-        "Ms. Morgan",
-        "Prof. Taylor",
-        "Dr. Romano",
-        "Ms. Wang",
-        "Mr. Garcia",
-        "Dr. Nakamura",
-        "Prof. Hernandez",
-        "Dr. Dubois",
-        "Ms. Kim",
-        "Mr. Miller",
-        "Prof. Jones",
-    ]
 
-    # only load the large csv once on a fresh db
-    addedcourses = 0
-    existingcourses = cur.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
-    if existingcourses == 0:
-        # fresh db path: build insert batch from csv
-        coursebatch = []
-        with open("choatecoursesp2284cleaned.csv", "r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            for index, raw in enumerate(reader):
-                row = cleankeys(raw)
-                coursecode = row.get("coursecode", "").strip()
-                coursename = row.get("title", "").strip()
-                description = (
-                    row.get("fulldescription")
-                    or row.get("sectionblurb")
-                    or "A Choate Rosemary Hall course."
-                ).strip()
-                if len(description) > 500:
-                    # cap long descriptions so rows stay manageable
-                    description = description[:497] + "..."
-                department = departmentfromcode(coursecode)
-                professor = professorpool[index % len(professorpool)]
-                coursebatch.append(
-                    (coursecode, coursename, department, professor, description)
-                )
+# version 2: per-course rating sums used by listings and leaderboards
+def migration2(con):
+    # course stats keeps running rating sums so pages never aggregate reviews
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS coursestats (
+            courseid INTEGER PRIMARY KEY,
+            reviewcount INTEGER NOT NULL DEFAULT 0,
+            ratingsum INTEGER NOT NULL DEFAULT 0,
+            difficultysum INTEGER NOT NULL DEFAULT 0,
+            workloadsum INTEGER NOT NULL DEFAULT 0,
+            interestsum INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (courseid) REFERENCES courses (id)
+        )
+        """
+    )
+    rebuildcoursestats(con)
+
 
-        cur.executemany(
+# version 3: fts5 search index, skipped quietly when sqlite lacks fts5
+def migration3(con):
+    buildsearchindex(con)
+
+
+# course level from the third character of the code, e.g. MA310 -> 300
+LEVELCOLUMN = """
+    level INTEGER GENERATED ALWAYS AS (
+        CASE
+            WHEN SUBSTR(coursecode, 3, 1) GLOB '[0-9]'
+            THEN CAST(SUBSTR(coursecode, 3, 1) AS INTEGER) * 100
+            ELSE NULL
+        END
+    ) VIRTUAL
+"""
+
+
+# version 4: lookup indexes plus a generated level column for filtering
+def migration4(con):
+    columns = [row[1] for row in con.execute("PRAGMA table_xinfo(courses)")]
+    if "level" not in columns:
+        # alter table can only add virtual generated columns, the index stores it
+        con.execute(f"ALTER TABLE courses ADD COLUMN {LEVELCOLUMN}")
+    for createsql in COURSEINDEXES.values():
+        con.execute(createsql)
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS reviewscoursedate ON reviews (courseid, dateposted)"
+    )
+
+
+# version 5: meta counters, dataversion moves on every write pages depend on
+def migration5(con):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """
+    )
+    con.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dataversion', 1)")
+
+
+# version 6: unix time of the last data write, used for last-modified headers
+def migration6(con):
+    con.execute(
+        """
+        INSERT OR IGNORE INTO meta (key, value)
+        VALUES ('datamodified', CAST(strftime('%s', 'now') AS INTEGER))
+        """
+    )
+
+
+# version 7: session generation per user plus an auth version for app caches
+# changing a password or the generation logs out every session for that user
+def migration7(con):
+    columns = [row[1] for row in con.execute("PRAGMA table_info(users)")]
+    if "sessiongeneration" not in columns:
+        con.execute(
+            "ALTER TABLE users ADD COLUMN sessiongeneration INTEGER NOT NULL DEFAULT 1"
+        )
+    con.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('authversion', 1)")
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS userspasswordchange
+        AFTER UPDATE OF passwordhash ON users
+        WHEN new.sessiongeneration = old.sessiongeneration
+        BEGIN
+            UPDATE users SET sessiongeneration = sessiongeneration + 1 WHERE id = new.id;
+        END
+        """
+    )
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS usersgenerationchange
+        AFTER UPDATE OF sessiongeneration ON users
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'authversion';
+        END
+        """
+    )
+    con.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS usersdelete AFTER DELETE ON users BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'authversion';
+        END
+        """
+    )
+
+
+# version 8: course codes are unique so catalog loads can upsert on them
+def migration8(con):
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS coursescode ON courses (coursecode)")
+
+
+# version 9: per-course version, bumped whenever that course's stats change
+# so rendered course cards can be cached per course instead of per page
+def migration9(con):
+    columns = [row[1] for row in con.execute("PRAGMA table_info(coursestats)")]
+    if "version" not in columns:
+        con.execute("ALTER TABLE coursestats ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+# version 10: the catalog moves out to its own file, which the app attaches
+# read-only and immutable, so catalog reads skip locking and wal checks
+def migration10(con):
+    hascourses = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'"
+    ).fetchone()
+    if hascourses is None:
+        return
+    dbpath = con.execute("PRAGMA database_list").fetchone()[2]
+    # ids carry over unchanged, reviews and coursestats point at them
+    rows = con.execute(
+        """
+        SELECT id, coursecode, coursename, department, professor, description
+        FROM courses
+        ORDER BY id
+        """
+    ).fetchall()
+
+    def copycourses(catcon):
+        catcon.executemany(
             """
-            INSERT INTO courses (coursecode, coursename, department, professor, description)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO courses (id, coursecode, coursename, department, professor, description)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
-            coursebatch,
+            rows,
         )
-        addedcourses = len(coursebatch)
-    else:
-        # existing db path: skip reseeding courses
-        coursebatch = []
+        if hassearchindex(catcon):
+            catcon.execute("INSERT INTO coursesearch (coursesearch) VALUES ('rebuild')")
+
+    publishcatalog(dbpath, copycourses, fromlive=False)
+    # dropping the tables takes their triggers and indexes with them
+    con.execute("DROP TABLE IF EXISTS coursesearch")
+    con.execute("DROP TABLE courses")
+
+
+# version 11: review sums per department, course, and semester for /stats trends
+# department is copied in from the catalog so trend reads never join it
+def migration11(con):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS semesterstats (
+            department TEXT NOT NULL,
+            courseid INTEGER NOT NULL,
+            termorder INTEGER NOT NULL,
+            semester TEXT NOT NULL,
+            reviewcount INTEGER NOT NULL DEFAULT 0,
+            ratingsum INTEGER NOT NULL DEFAULT 0,
+            difficultysum INTEGER NOT NULL DEFAULT 0,
+            workloadsum INTEGER NOT NULL DEFAULT 0,
+            interestsum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (department, courseid, termorder)
+        ) WITHOUT ROWID
+        """
+    )
+    # trends read only the latest few semesters
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS semesterstatsterm ON semesterstats (termorder)"
+    )
+    rebuildsemesterstats(con)
+
+
+# version 12: smoothed course scores and precomputed leaderboards
+# department is copied onto coursestats so a department's top list is one
+# index range instead of a join against the catalog
+def migration12(con):
+    columns = [row[1] for row in con.execute("PRAGMA table_info(coursestats)")]
+    if "department" not in columns:
+        con.execute("ALTER TABLE coursestats ADD COLUMN department TEXT")
+    if "score" not in columns:
+        con.execute("ALTER TABLE coursestats ADD COLUMN score REAL")
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS coursestatsscore
+        ON coursestats (score DESC, reviewcount DESC, courseid)
+        WHERE reviewcount > 0
+        """
+    )
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS coursestatsdepartmentscore
+        ON coursestats (department, score DESC, reviewcount DESC, courseid)
+        WHERE reviewcount > 0
+        """
+    )
+    # scope is a department, or '' for the list across all of them
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboards (
+            scope TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            courseid INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (scope, position)
+        ) WITHOUT ROWID
+        """
+    )
+    rebuildrankings(con)
+
+
+# ordered list of migrations, position + 1 is the schema version it produces
+MIGRATIONS = [
+    migration1,
+    migration2,
+    migration3,
+    migration4,
+    migration5,
+    migration6,
+    migration7,
+    migration8,
+    migration9,
+    migration10,
+    migration11,
+    migration12,
+]
+
+
+# tell every app worker that cached pages and facets are stale
+def bumpdataversion(con):
+    con.execute(
+        """
+        UPDATE meta
+        SET value = CASE key
+            WHEN 'dataversion' THEN value + 1
+            ELSE CAST(strftime('%s', 'now') AS INTEGER)
+        END
+        WHERE key IN ('dataversion', 'datamodified')
+        """
+    )
+
+
+# apply every migration newer than the db's user_version, one transaction each
+def migratedatabase(con):
+    current = con.execute("PRAGMA user_version").fetchone()[0]
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            # already applied on this db
+            continue
+        con.execute("BEGIN")
+        try:
+            migration(con)
+            con.execute(f"PRAGMA user_version = {version}")
+            con.commit()
+        except Exception:
+            # leave the db at the last good version
+            con.rollback()
+            raise
+        print(f"Applied schema migration {version}")
+        current = version
+    return current
+
+
+# true when the fts5 table exists, schema is "catalog" on an attached connection
+def hassearchindex(con, schema="main"):
+    found = con.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'coursesearch'"
+    ).fetchone()
+    return found is not None
+
+
+# catalog file schema: courses with its level column, indexes, and search index
+def createcatalogtables(con):
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            coursecode TEXT NOT NULL,
+            coursename TEXT NOT NULL,
+            department TEXT NOT NULL,
+            professor TEXT,
+            description TEXT,
+            {LEVELCOLUMN}
+        )
+        """
+    )
+    for createsql in COURSEINDEXES.values():
+        con.execute(createsql)
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS coursescode ON courses (coursecode)")
+    buildsearchindex(con)
+
+
+def removetempcatalog(temppath):
+    for leftover in [temppath, temppath + "-journal", temppath + "-wal", temppath + "-shm"]:
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+# build the next catalog in a temp file, then swap it in with one rename so
+# readers only ever open a complete file; fill(catcon) writes the rows
+# fromlive starts from the published catalog so existing course ids are kept
+def publishcatalog(dbpath, fill, fromlive=True):
+    catalogpath = catalogpathfor(dbpath)
+    temppath = f"{catalogpath}.{os.getpid()}.tmp"
+    # a crashed earlier publish, never the live file
+    removetempcatalog(temppath)
+
+    catcon = sqlite3.connect(temppath)
+    try:
+        if fromlive and os.path.exists(catalogpath):
+            liveuri = f"file:{pathname2url(os.path.abspath(catalogpath))}?mode=ro"
+            live = sqlite3.connect(liveuri, uri=True)
+            live.backup(catcon)
+            live.close()
+        createcatalogtables(catcon)
+        result = fill(catcon)
+        catcon.commit()
+        # immutable readers cannot see a wal, so fold everything into the main file
+        catcon.execute("PRAGMA journal_mode = DELETE")
+        catcon.execute("ANALYZE")
+        catcon.commit()
+    except BaseException:
+        catcon.close()
+        # a failed fill must not leave its half-built file beside the live catalog
+        removetempcatalog(temppath)
+        raise
+    catcon.close()
+    os.replace(temppath, catalogpath)
+    return result
+
+
+# placeholder teachers handed out round robin as catalog rows load
+PROFESSORPOOL = [
+    "Dr. Thompson",
+    "Ms. Rodriguez",
+    "Mr. Chen",
+    "Dr. Martinez",
+    "Prof. Blake",
+    "Dr. Harrison",
+    "Ms. Williams",
+    "Mr. Johnson",
+    "Dr. Anderson",
+    "Ms. Lee",
+    "Prof. Kumar",
+    "Dr. Zhang",
+    "Mr. Brown",
+    "Dr. Green",
+    "Ms. Clark",
+    "Prof. Walker",
+    "Dr. Adams",
+    "Ms. Rivera",
+    "Mr. Collins",
+    "Dr. Foster",
+    "Prof. Bennett",
+    "Dr. Patel",
+    "Ms. Singh",
+    "Mr. Davis",
+    "Dr. Wilson",
+    "Ms. Morgan",
+    "Prof. Taylor",
+    "Dr. Romano",
+    "Ms. Wang",
+    "Mr. Garcia",
+    "Dr. Nakamura",
+    "Prof. Hernandez",
+    "Dr. Dubois",
+    "Ms. Kim",
+    "Mr. Miller",
+    "Prof. Jones",
+]
+
+
+# catalog source and how many rows go into each insert batch
+CATALOGCSVPATH = os.environ.get("COURSECATALOGCSV", "choatecoursesp2284cleaned.csv")
+CATALOGCHUNKSIZE = int(os.environ.get("CATALOGCHUNKSIZE", "5000"))
+
+# secondary course indexes, dropped during a load and rebuilt once at the end
+COURSEINDEXES = {
+    "courseslevel": "CREATE INDEX IF NOT EXISTS courseslevel ON courses (level)",
+    "coursesdepartmentcode": (
+        "CREATE INDEX IF NOT EXISTS coursesdepartmentcode ON courses (department, coursecode)"
+    ),
+}
+
+
+# stream course tuples from the csv in fixed size chunks
+def readcatalogchunks(csvpath, chunksize):
+    with open(csvpath, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        # clean header names once instead of every row like cleankeys does
+        positions = {}
+        for index, name in enumerate(header):
+            positions[name.replace(chr(95), "").replace("-", "")] = index
+        codeat = positions.get("coursecode")
+        titleat = positions.get("title")
+        fullat = positions.get("fulldescription")
+        blurbat = positions.get("sectionblurb")
+        # every row has to reach the last column we read from
+        width = max(
+            (at for at in (codeat, titleat, fullat, blurbat) if at is not None),
+            default=-1,
+        ) + 1
+
+        chunk = []
+        for index, raw in enumerate(reader):
+            if not raw or len(raw) < width:
+                # blank lines and truncated rows, like DictReader skipping blanks
+                continue
+            coursecode = raw[codeat].strip() if codeat is not None else ""
+            if not coursecode:
+                # rows without a code cannot be upserted
+                continue
+            coursename = raw[titleat].strip() if titleat is not None else ""
+            description = (
+                (raw[fullat] if fullat is not None else "")
+                or (raw[blurbat] if blurbat is not None else "")
+                or "A Choate Rosemary Hall course."
+            ).strip()
+            if len(description) > 500:
+                # cap long descriptions so rows stay manageable
+                description = description[:497] + "..."
+            department = departmentfromcode(coursecode)
+            professor = PROFESSORPOOL[index % len(PROFESSORPOOL)]
+            chunk.append((coursecode, coursename, department, professor, description))
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# fast and unsafe settings for the length of a load, restored after
+# a load into an empty table also skips per-row fts work and indexes once at the end
+def startbulkload(con, freshload):
+    con.commit()
+    con.execute("PRAGMA synchronous = OFF")
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+    except sqlite3.OperationalError:
+        # another process still has the db open, stay in the current mode
+        pass
+    for name in COURSEINDEXES:
+        con.execute(f"DROP INDEX IF EXISTS {name}")
+    if freshload:
+        con.execute("DROP TRIGGER IF EXISTS coursesearchinsert")
+
+
+def finishbulkload(con, freshload):
+    for createsql in COURSEINDEXES.values():
+        con.execute(createsql)
+    if freshload and hassearchindex(con):
+        # put the insert trigger back and index every loaded row in one pass
+        buildsearchindex(con)
+        con.execute("INSERT INTO coursesearch (coursesearch) VALUES ('rebuild')")
+    con.commit()
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+
+
+# upsert the catalog csv on coursecode, unchanged rows are left untouched
+def loadcatalog(con, csvpath, chunksize=CATALOGCHUNKSIZE):
+    started = time.perf_counter()
+    before = con.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+    readrows = 0
+    writtenrows = 0
+
+    freshload = before == 0
+    startbulkload(con, freshload)
+    try:
+        for chunk in readcatalogchunks(csvpath, chunksize):
+            # known codes never reach the insert, on courses AUTOINCREMENT every
+            # conflicting insert would still use up an id
+            existing = set()
+            if not freshload:
+                codes = [row[0] for row in chunk]
+                existing = {
+                    row[0]
+                    for row in con.execute(
+                        f"SELECT coursecode FROM courses WHERE coursecode IN ({', '.join('?' * len(codes))})",
+                        codes,
+                    )
+                }
+            inserted = con.executemany(
+                """
+                INSERT INTO courses (coursecode, coursename, department, professor, description)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (coursecode) DO UPDATE SET
+                    coursename = excluded.coursename,
+                    department = excluded.department,
+                    professor = excluded.professor,
+                    description = excluded.description
+                WHERE courses.coursename IS NOT excluded.coursename
+                    OR courses.department IS NOT excluded.department
+                    OR courses.professor IS NOT excluded.professor
+                    OR courses.description IS NOT excluded.description
+                """,
+                [row for row in chunk if row[0] not in existing],
+            )
+            updated = con.executemany(
+                """
+                UPDATE courses
+                SET coursename = ?, department = ?, professor = ?, description = ?
+                WHERE coursecode = ?
+                    AND (coursename IS NOT ?
+                        OR department IS NOT ?
+                        OR professor IS NOT ?
+                        OR description IS NOT ?)
+                """,
+                [(*row[1:], row[0], *row[1:]) for row in chunk if row[0] in existing],
+            )
+            # rowcounts cover inserts plus updates that actually changed a row,
+            # the insert keeps its upsert for codes repeated inside the csv
+            writtenrows += inserted.rowcount + updated.rowcount
+            readrows += len(chunk)
+            con.commit()
+    finally:
+        finishbulkload(con, freshload)
+
+    after = con.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+    seconds = time.perf_counter() - started
+    return {
+        "read": readrows,
+        "inserted": after - before,
+        "updated": writtenrows - (after - before),
+        "seconds": seconds,
+        "rowspersecond": readrows / seconds if seconds else 0,
+    }
+
+
+def printloadstats(loadstats):
+    print(
+        f"Catalog load: {loadstats['read']} rows read, "
+        f"{loadstats['inserted']} inserted, {loadstats['updated']} updated "
+        f"in {loadstats['seconds']:.2f}s ({loadstats['rowspersecond']:.0f} rows/sec)"
+    )
+
+
+# create tables and seed starter data if db is empty
+def builddatabase():
+    dbpath, con = opendatabase()
+    cur = con.cursor()
+
+    # bring schema up to date before touching any data
+    schemaversion = migratedatabase(con)
+
+    # stream the catalog csv into a fresh copy of the catalog and publish it
+    loadstats = publishcatalog(dbpath, lambda catcon: loadcatalog(catcon, CATALOGCSVPATH))
+    addedcourses = loadstats["inserted"]
+    attachcatalog(con, dbpath)
+    hasfts = hassearchindex(con, "catalog")
 
     # create a default login user if it does not exist yet
     adminusername = os.environ.get("APPADMINUSERNAME", "admin")
@@ -422,7 +1080,14 @@ def builddatabase():
         )
         addedreviews = len(samplereviews)
 
+    # backfill summary rows so they always match the reviews table
+    statsrows = rebuildcoursestats(con)
+    semesterrows = rebuildsemesterstats(con)
+    bumpdataversion(con)
     con.commit()
+    # refresh planner stats now that the new indexes have data, the
+    # catalog got its own before publishing and must not change in place
+    con.execute("ANALYZE main")
     cur.execute(
         """
         SELECT department, COUNT(*) countvalue
@@ -439,8 +1104,16 @@ def builddatabase():
     print("DATABASE READY")
     print("=" * 62)
     print(f"Database path: {dbpath}")
+    print(f"Catalog path: {catalogpathfor(dbpath)}")
+    print(f"Schema version: {schemaversion}")
     print(f"Added {addedcourses} courses")
+    printloadstats(loadstats)
     print(f"Added {addedreviews} sample reviews")
+    print(f"Rebuilt stats for {statsrows} courses")
+    print(f"Rebuilt {semesterrows} semester trend rows")
+    if not hasfts:
+        # app will use slower LIKE search on this sqlite build
+        print("FTS5 unavailable, search falls back to LIKE")
     if admincreated:
         # brand new admin user was created this run
         print(f"Created login user: {adminusername}")
@@ -454,6 +1127,71 @@ def builddatabase():
     print("Run: python app.py")
 
 
+# upgrade an existing db in place without reseeding anything
+def migratecommand():
+    dbpath, con = opendatabase()
+    schemaversion = migratedatabase(con)
+    con.close()
+    print(f"{dbpath} is at schema version {schemaversion}")
+
+
+# reload just the catalog csv, e.g. python initdb.py loadcatalog othercatalog.csv
+def loadcatalogcommand(csvpath):
+    dbpath, con = opendatabase()
+    migratedatabase(con)
+    loadstats = publishcatalog(dbpath, lambda catcon: loadcatalog(catcon, csvpath))
+    # running app workers reopen their connections once they see the new file
+    attachcatalog(con, dbpath)
+    rebuildcoursestats(con)
+    # a course may have moved department
+    rebuildsemesterstats(con)
+    bumpdataversion(con)
+    con.commit()
+    con.close()
+    printloadstats(loadstats)
+
+
+# rebuild only the summary tables, for repairs after manual db edits
+def rebuildstatscommand():
+    dbpath, con = opendatabase()
+    attachcatalog(con, dbpath)
+    statsrows = rebuildcoursestats(con)
+    semesterrows = rebuildsemesterstats(con)
+    bumpdataversion(con)
+    con.commit()
+    con.close()
+    print(f"Rebuilt stats for {statsrows} courses in {dbpath}")
+    print(f"Rebuilt {semesterrows} semester trend rows")
+
+
+# force every session of one user to log in again
+def revokesessionscommand(username):
+    dbpath, con = opendatabase()
+    cur = con.execute(
+        "UPDATE users SET sessiongeneration = sessiongeneration + 1 WHERE username = ?",
+        (username,),
+    )
+    con.commit()
+    con.close()
+    if cur.rowcount:
+        print(f"Revoked sessions for {username}")
+    else:
+        print(f"No such user: {username}")
+
+
 if __name__ == "__main__":
-    # run db init when this file is executed directly
-    builddatabase()
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        # python initdb.py migrate
+        migratecommand()
+    elif len(sys.argv) > 2 and sys.argv[1] == "revokesessions":
+        # python initdb.py revokesessions <username>
+        revokesessionscommand(sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == "loadcatalog":
+        # python initdb.py loadcatalog [csvpath]
+        loadcatalogcommand(sys.argv[2] if len(sys.argv) > 2 else CATALOGCSVPATH)
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuildstats":
+        # python initdb.py rebuildstats
+        rebuildstatscommand()
+    else:
+        # run db init when this file is executed directly
+        builddatabase()
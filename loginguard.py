@@ -0,0 +1,117 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import os
+import threading
+import time
+
+
+# pbkdf2 threads per worker, plus how many more attempts may wait for one
+LOGINWORKERS = int(os.environ.get("LOGINWORKERS", "2"))
+LOGINQUEUE = int(os.environ.get("LOGINQUEUE", "4"))
+# give up waiting on a queued verification after this many seconds
+LOGINTIMEOUT = float(os.environ.get("LOGINTIMEOUT", "10"))
+
+
+# raised when the verify pool is full, maps to a 503
+class LoginBusy(Exception):
+    pass
+
+
+# raised when a username or ip is over its attempt budget, maps to a 429
+class LoginThrottled(Exception):
+    def __init__(self, retryafter):
+        super().__init__(retryafter)
+        self.retryafter = retryafter
+
+
+# counts attempts per key inside a rolling window
+# keys are kept in lru order and capped so a spray of usernames cannot grow memory
+class SlidingWindowLimiter:
+    def __init__(self, limit, window, maxkeys=10000):
+        self.limit = limit
+        self.window = window
+        self.maxkeys = maxkeys
+        self.attempts = OrderedDict()
+        self.lock = threading.Lock()
+
+    # record one attempt, return seconds to wait if over the limit else 0
+    def hit(self, key):
+        now = time.monotonic()
+        with self.lock:
+            stamps = self.attempts.get(key)
+            if stamps is None:
+                stamps = deque()
+                self.attempts[key] = stamps
+            self.attempts.move_to_end(key)
+            while stamps and stamps[0] <= now - self.window:
+                # forget attempts that slid out of the window
+                stamps.popleft()
+            if len(stamps) >= self.limit:
+                return max(1, int(stamps[0] + self.window - now) + 1)
+            stamps.append(now)
+            while len(self.attempts) > self.maxkeys:
+                self.attempts.popitem(last=False)
+            return 0
+
+    # successful login clears the username budget
+    def reset(self, key):
+        with self.lock:
+            self.attempts.pop(key, None)
+
+
+usernamelimiter = SlidingWindowLimiter(
+    int(os.environ.get("LOGINUSERLIMIT", "5")),
+    int(os.environ.get("LOGINUSERWINDOW", "60")),
+)
+iplimiter = SlidingWindowLimiter(
+    int(os.environ.get("LOGINIPLIMIT", "20")),
+    int(os.environ.get("LOGINIPWINDOW", "60")),
+)
+
+verifypool = ThreadPoolExecutor(max_workers=LOGINWORKERS, thread_name_prefix="login")
+# running + queued verifications, non-blocking acquire gives the fast reject
+verifyslots = threading.BoundedSemaphore(LOGINWORKERS + LOGINQUEUE)
+guardstats = {"accepted": 0, "busy": 0, "throttled": 0, "timeouts": 0}
+statslock = threading.Lock()
+
+
+def countstat(name):
+    with statslock:
+        guardstats[name] += 1
+
+
+# check both budgets before any hashing happens
+def admitattempt(username, ipaddress):
+    for limiter, key in ((iplimiter, ipaddress), (usernamelimiter, username.lower())):
+        retryafter = limiter.hit(key)
+        if retryafter:
+            countstat("throttled")
+            raise LoginThrottled(retryafter)
+
+
+# run a password check on the bounded pool and wait for its answer
+def runverification(check, *args):
+    if not verifyslots.acquire(blocking=False):
+        countstat("busy")
+        raise LoginBusy()
+    try:
+        future = verifypool.submit(check, *args)
+    except Exception:
+        verifyslots.release()
+        raise
+    # the slot frees when the hash finishes, even if we stopped waiting
+    future.add_done_callback(lambda done: verifyslots.release())
+    countstat("accepted")
+    try:
+        return future.result(timeout=LOGINTIMEOUT)
+    except TimeoutError:
+        countstat("timeouts")
+        raise LoginBusy()
+
+
+def loginstats():
+    with statslock:
+        stats = dict(guardstats)
+    stats["workers"] = LOGINWORKERS
+    stats["queue"] = LOGINQUEUE
+    return stats
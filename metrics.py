@@ -0,0 +1,262 @@
+from bisect import bisect_left
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# off by default, APPMETRICS=1 turns on timing hooks and /metrics output
+ENABLED = os.environ.get("APPMETRICS", "") == "1"
+
+SECONDSBUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+COUNTBUCKETS = [0, 1, 2, 3, 5, 8, 13, 21, 50, 100]
+
+
+# cumulative prometheus histogram keyed by a tuple of label values
+class Histogram:
+    def __init__(self, name, helptext, labelnames, buckets):
+        self.name = name
+        self.helptext = helptext
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # one slot per bucket plus +Inf, then sum
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self.series[labels] = series
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.helptext}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for labels, counts, total in sorted(snapshot):
+            labeltext = formatlabels(self.labelnames, labels)
+            running = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                running += count
+                bucketlabels = formatlabels(self.labelnames + ("le",), labels + (str(bound),))
+                lines.append(f"{self.name}_bucket{bucketlabels} {running}")
+            lines.append(f"{self.name}_sum{labeltext} {total}")
+            lines.append(f"{self.name}_count{labeltext} {running}")
+        return lines
+
+
+def formatlabels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+requestseconds = Histogram(
+    "courseapp_request_seconds",
+    "Wall time per request.",
+    ("route", "method", "status"),
+    SECONDSBUCKETS,
+)
+templateseconds = Histogram(
+    "courseapp_template_render_seconds",
+    "Time spent rendering each template.",
+    ("template",),
+    SECONDSBUCKETS,
+)
+sqlseconds = Histogram(
+    "courseapp_sql_seconds",
+    "Total sqlite execute and fetch time per request, lock waits included.",
+    ("route",),
+    SECONDSBUCKETS,
+)
+sqlstatements = Histogram(
+    "courseapp_sql_statements",
+    "Statements the app issued per request.",
+    ("route",),
+    COUNTBUCKETS,
+)
+histograms = [requestseconds, templateseconds, sqlseconds, sqlstatements]
+
+# per-thread tallies for the request being served
+current = threading.local()
+
+
+def resetcurrent():
+    current.active = True
+    current.statements = 0
+    current.sqlseconds = 0.0
+    current.renderstarts = []
+
+
+def addsqltime(seconds):
+    if getattr(current, "active", False):
+        current.sqlseconds += seconds
+
+
+# fts5 reaches its shadow tables through a quoted schema, 'main'. or 'catalog'.
+INTERNALPATTERN = re.compile(r"^(PRAGMA|SELECT .*? FROM|INSERT INTO|REPLACE INTO|DELETE FROM) '\w+'\.")
+
+
+# true for statements the app issued, false for trigger bodies ("-- " prefixed)
+# and the statements fts5 runs internally against its shadow tables
+# benchmark/runner.py counts with this too, so both query counts agree
+def isappstatement(statement):
+    return not statement.startswith("--") and not INTERNALPATTERN.match(statement)
+
+
+# trace hook: count app statements into the current request
+def tracestatement(statement):
+    if isappstatement(statement) and getattr(current, "active", False):
+        current.statements += 1
+
+
+# callbacks given (cursor, seconds) after every timed cursor call, the cursor
+# carries .statement, .parameters, and .elapsed for its current execution
+statementobservers = []
+
+
+# cursor that times execute and fetch calls into the current request
+class TimedCursor(sqlite3.Cursor):
+    statement = None
+    parameters = None
+    many = False
+    elapsed = 0.0
+    reported = False
+
+    def timed(self, started):
+        seconds = time.perf_counter() - started
+        self.elapsed += seconds
+        addsqltime(seconds)
+        for observer in statementobservers:
+            observer(self, seconds)
+
+    def startstatement(self, sql, parameters, many):
+        self.statement = sql
+        self.parameters = parameters
+        self.many = many
+        self.elapsed = 0.0
+        self.reported = False
+
+    def execute(self, sql, parameters=()):
+        self.startstatement(sql, parameters, False)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.timed(started)
+
+    def executemany(self, sql, parameters):
+        self.startstatement(sql, None, True)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.timed(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self.timed(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            if size is None:
+                return super().fetchmany()
+            return super().fetchmany(size)
+        finally:
+            self.timed(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self.timed(started)
+
+
+# connection whose shortcut execute methods go through TimedCursor
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+def traceconnection(con):
+    con.set_trace_callback(tracestatement)
+
+
+def routelabel(request):
+    if request.url_rule is None:
+        # keep 404 probes from creating a label per path
+        return "unmatched"
+    return request.url_rule.rule
+
+
+# wire request, template, and sqlite hooks into the app
+def install(app, connectionhooks):
+    from flask import before_render_template, request, template_rendered
+
+    connectionhooks.append(traceconnection)
+
+    @app.before_request
+    def startrequest():
+        resetcurrent()
+        current.started = time.perf_counter()
+
+    @app.after_request
+    def finishrequest(response):
+        if not getattr(current, "active", False):
+            return response
+        route = routelabel(request)
+        elapsed = time.perf_counter() - current.started
+        requestseconds.observe((route, request.method, str(response.status_code)), elapsed)
+        sqlseconds.observe((route,), current.sqlseconds)
+        sqlstatements.observe((route,), current.statements)
+        current.active = False
+        return response
+
+    def startrender(sender, template, context, **extra):
+        if getattr(current, "active", False):
+            current.renderstarts.append(time.perf_counter())
+
+    def finishrender(sender, template, context, **extra):
+        if getattr(current, "active", False) and current.renderstarts:
+            elapsed = time.perf_counter() - current.renderstarts.pop()
+            templateseconds.observe((template.name or "inline",), elapsed)
+
+    before_render_template.connect(startrender, app, weak=False)
+    template_rendered.connect(finishrender, app, weak=False)
+
+
+# prometheus text for this worker, plus gauges the app passes in
+# gauges is a list of (name, helptext, type, [(labels dict, value)])
+def render(gauges):
+    lines = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    for name, helptext, metrictype, samples in gauges:
+        lines.append(f"# HELP {name} {helptext}")
+        lines.append(f"# TYPE {name} {metrictype}")
+        for labels, value in samples:
+            labeltext = formatlabels(tuple(labels), tuple(labels.values()))
+            lines.append(f"{name}{labeltext} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,83 @@
+import os
+
+
+# bayesian course scores plus ready-made top lists per department
+# every course starts with PRIORWEIGHT phantom reviews at the site-wide mean,
+# so one 5-star review no longer outranks forty 4.8s; both numbers live in
+# meta so the app and initdb score with the same prior
+
+# how many rows each leaderboard keeps, /stats shows the first 10 overall
+LEADERBOARDSIZE = int(os.environ.get("LEADERBOARDSIZE", "25"))
+# scope of the leaderboard across all departments
+ALLSCOPE = ""
+
+
+# smoothed score for a course with these sums, as a sql expression so the
+# coursestats upsert can set it in the same statement that moves the sums
+def scoresql(ratingsum, reviewcount):
+    return f"""(
+        {ratingsum}
+        + (SELECT value FROM meta WHERE key = 'priorweight')
+        * (SELECT value FROM meta WHERE key = 'priormean')
+    ) / (CAST({reviewcount} AS REAL) + (SELECT value FROM meta WHERE key = 'priorweight'))"""
+
+
+# rescore every course against the current prior, unreviewed ones get none
+def rescorecourses(con):
+    con.execute(
+        f"""
+        UPDATE coursestats
+        SET score = CASE
+            WHEN reviewcount > 0 THEN {scoresql("ratingsum", "reviewcount")}
+            ELSE NULL
+        END
+        """
+    )
+
+
+# copy department onto coursestats so each department's list is one index range
+# departments maps course id -> department from the catalog
+def setdepartments(con, departments):
+    con.executemany(
+        "UPDATE coursestats SET department = ? WHERE courseid = ?",
+        [(department, courseid) for courseid, department in departments.items()],
+    )
+
+
+# rewrite the top lists for the given departments plus the overall one,
+# each is one short walk down a partial index on score
+def refreshleaderboards(con, departments):
+    for scope in [ALLSCOPE, *sorted(set(departments))]:
+        if scope == ALLSCOPE:
+            top = con.execute(
+                """
+                SELECT courseid, score
+                FROM coursestats
+                WHERE reviewcount > 0 AND score IS NOT NULL
+                ORDER BY score DESC, reviewcount DESC, courseid
+                LIMIT ?
+                """,
+                (LEADERBOARDSIZE,),
+            ).fetchall()
+        else:
+            top = con.execute(
+                """
+                SELECT courseid, score
+                FROM coursestats
+                WHERE department = ? AND reviewcount > 0 AND score IS NOT NULL
+                ORDER BY score DESC, reviewcount DESC, courseid
+                LIMIT ?
+                """,
+                (scope, LEADERBOARDSIZE),
+            ).fetchall()
+        con.execute("DELETE FROM leaderboards WHERE scope = ?", (scope,))
+        con.executemany(
+            """
+            INSERT INTO leaderboards (scope, position, courseid, score)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (scope, position, courseid, score)
+                for position, (courseid, score) in enumerate(top, start=1)
+            ],
+        )
@@ -0,0 +1,79 @@
+import re
+from datetime import datetime, timezone
+
+
+# per (department, course, semester) rating sums behind the /stats trends
+# app.py folds each review batch in, initdb.py rebuilds the table from reviews
+
+# term position inside one calendar year, so year * 4 + term sorts semesters
+TERMS = {"winter": 0, "spring": 1, "summer": 2, "fall": 3, "autumn": 3}
+TERMNAMES = ["Winter", "Spring", "Summer", "Fall"]
+# january through december, used when the semester text names no term
+MONTHTERMS = [0, 0, 0, 1, 1, 1, 2, 2, 3, 3, 3, 3]
+SEMESTERPATTERN = re.compile(r"(winter|spring|summer|fall|autumn)\W*(\d{4}|\d{2})\b")
+DATEPATTERN = re.compile(r"(\d{4})-(\d{2})")
+
+
+# (termorder, label) for free text like "fall 2025" or "Spring '26"
+# anything else falls back to the term the review was posted in
+def termfor(semester, dateposted=None):
+    match = SEMESTERPATTERN.search((semester or "").casefold())
+    if match:
+        term = TERMS[match.group(1)]
+        year = int(match.group(2))
+        if year < 100:
+            year += 2000
+    else:
+        # dateposted is sqlite datetime('now') text, new rows have none yet
+        posted = DATEPATTERN.match(dateposted or "")
+        if posted is None:
+            posted = DATEPATTERN.match(datetime.now(timezone.utc).strftime("%Y-%m"))
+        year = int(posted.group(1))
+        term = MONTHTERMS[int(posted.group(2)) - 1]
+    return year * 4 + term, f"{TERMNAMES[term]} {year}"
+
+
+# sum review rows into rollup rows, reviews of courses missing from the
+# catalog are skipped like the coursestats join skips them
+# rows are (courseid, overall, difficulty, workload, interest, semester, dateposted)
+def foldreviews(rows, departments):
+    rollup = {}
+    for courseid, overall, difficulty, workload, interest, semester, dateposted in rows:
+        department = departments.get(courseid)
+        if department is None:
+            continue
+        termorder, label = termfor(semester, dateposted)
+        sums = rollup.setdefault((department, courseid, termorder), [label, 0, 0, 0, 0, 0])
+        sums[1] += 1
+        sums[2] += overall
+        sums[3] += difficulty
+        sums[4] += workload
+        sums[5] += interest
+    return [(*key, *sums) for key, sums in rollup.items()]
+
+
+# add folded rows onto the table in the caller's transaction
+def addsemesterstats(con, rollup):
+    con.executemany(
+        """
+        INSERT INTO semesterstats (
+            department,
+            courseid,
+            termorder,
+            semester,
+            reviewcount,
+            ratingsum,
+            difficultysum,
+            workloadsum,
+            interestsum
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (department, courseid, termorder) DO UPDATE SET
+            reviewcount = reviewcount + excluded.reviewcount,
+            ratingsum = ratingsum + excluded.ratingsum,
+            difficultysum = difficultysum + excluded.difficultysum,
+            workloadsum = workloadsum + excluded.workloadsum,
+            interestsum = interestsum + excluded.interestsum
+        """,
+        rollup,
+    )
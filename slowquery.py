@@ -0,0 +1,189 @@
+from collections import OrderedDict
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# statements slower than this many ms get logged, unset means the log is off
+THRESHOLDTEXT = os.environ.get("SLOWQUERYMS", "")
+ENABLED = THRESHOLDTEXT != ""
+THRESHOLDMS = float(THRESHOLDTEXT) if ENABLED else 0.0
+LOGPATH = os.environ.get("SLOWQUERYLOG", "slowqueries.jsonl")
+
+# shapes whose plan was already captured by this worker
+explainedshapes = OrderedDict()
+MAXEXPLAINED = 2000
+loglock = threading.Lock()
+# set while we run explain so our own statements are not observed
+busy = threading.local()
+
+
+# collapse a statement to its shape: literals become ?, in lists shrink,
+# whitespace and case are normalized so dynamic filter combos group together
+def normalizesql(sql):
+    shape = re.sub(r"--[^\n]*", " ", sql)
+    shape = re.sub(r"'(?:[^']|'')*'", "?", shape)
+    shape = re.sub(r"\b\d+(?:\.\d+)?\b", "?", shape)
+    shape = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?...)", shape)
+    shape = re.sub(r"\s+", " ", shape).strip()
+    return shape.lower()
+
+
+def shapeid(shape):
+    return hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+
+
+# map aliases like "courses c" back to table names for scan detection
+def tablealiases(shape):
+    aliases = {}
+    for table, alias in re.findall(r"\b(?:from|join)\s+(\w+)(?:\s+(?:as\s+)?(\w+))?", shape):
+        aliases[table] = table
+        if alias and alias not in {"on", "where", "join", "left", "inner", "group", "order", "limit"}:
+            aliases[alias] = table
+    return aliases
+
+
+# table names the plan reads end to end, index-only scans included
+def findfullscans(shape, plan):
+    aliases = tablealiases(shape)
+    scans = []
+    for detail in plan:
+        found = re.match(r"SCAN (\w+)", detail)
+        if found is None or "VIRTUAL TABLE" in detail:
+            continue
+        table = aliases.get(found.group(1).lower(), found.group(1).lower())
+        if "INDEX" in detail:
+            table += " (index)"
+        if table not in scans:
+            scans.append(table)
+    return scans
+
+
+def explainplan(con, sql, parameters):
+    busy.active = True
+    try:
+        # plain cursor so the explain itself is not timed or observed
+        cursor = con.cursor(sqlite3.Cursor)
+        rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters or ()).fetchall()
+        return [row[3] for row in rows]
+    except sqlite3.Error as error:
+        return [f"explain failed: {error}"]
+    finally:
+        busy.active = False
+
+
+# keep parameters readable and bounded in the log
+def cleanparameters(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        parameters = list(parameters.items())
+    cleaned = []
+    for value in parameters:
+        if isinstance(value, (bytes, memoryview)):
+            value = f"<{len(value)} bytes>"
+        elif isinstance(value, str) and len(value) > 200:
+            value = value[:200] + "..."
+        elif isinstance(value, tuple):
+            value = list(value)
+        cleaned.append(value)
+    return cleaned
+
+
+def writeentry(entry):
+    line = json.dumps(entry, default=str) + "\n"
+    with loglock:
+        with open(LOGPATH, "a", encoding="utf-8") as file:
+            file.write(line)
+
+
+# metrics.TimedCursor observer, logs a statement once when it crosses the threshold
+def observestatement(cursor, seconds):
+    if cursor.reported or getattr(busy, "active", False) or cursor.statement is None:
+        return
+    elapsedms = cursor.elapsed * 1000
+    if elapsedms < THRESHOLDMS:
+        return
+    cursor.reported = True
+
+    shape = normalizesql(cursor.statement)
+    shapekey = shapeid(shape)
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pid": os.getpid(),
+        "shapeid": shapekey,
+        "shape": shape,
+        "parameters": cleanparameters(cursor.parameters),
+        "elapsedms": round(elapsedms, 3),
+    }
+    with loglock:
+        explained = shapekey in explainedshapes
+        if not explained:
+            explainedshapes[shapekey] = True
+            while len(explainedshapes) > MAXEXPLAINED:
+                explainedshapes.popitem(last=False)
+    if not explained and not cursor.many:
+        # capture the plan once per shape per worker, it rarely changes
+        plan = explainplan(cursor.connection, cursor.statement, cursor.parameters)
+        entry["plan"] = plan
+        entry["fullscans"] = findfullscans(shape, plan)
+    writeentry(entry)
+
+
+def install(statementobservers):
+    statementobservers.append(observestatement)
+
+
+def readentries(logpath):
+    with open(logpath, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# group the log by shape and print the shapes costing the most total time
+def summarize(logpath, top):
+    shapes = {}
+    for entry in readentries(logpath):
+        summary = shapes.setdefault(
+            entry["shapeid"],
+            {"shape": entry["shape"], "times": [], "plan": None, "fullscans": []},
+        )
+        summary["times"].append(entry["elapsedms"])
+        if entry.get("plan") and summary["plan"] is None:
+            summary["plan"] = entry["plan"]
+            summary["fullscans"] = entry.get("fullscans", [])
+
+    ranked = sorted(shapes.items(), key=lambda item: sum(item[1]["times"]), reverse=True)
+    if not ranked:
+        print(f"No slow queries in {logpath}")
+        return
+    for index, (key, summary) in enumerate(ranked[:top], start=1):
+        times = sorted(summary["times"])
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(
+            f"{index}. {key} count={len(times)} total={sum(times):.1f}ms "
+            f"max={times[-1]:.1f}ms p95={p95:.1f}ms"
+        )
+        if summary["fullscans"]:
+            print(f"   FULL SCAN: {', '.join(summary['fullscans'])}")
+        print(f"   {summary['shape'][:400]}")
+        for detail in summary["plan"] or []:
+            print(f"     plan: {detail}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python slowquery.py",
+        description="Summarize the slow query log written when SLOWQUERYMS is set.",
+    )
+    parser.add_argument("logpath", nargs="?", default=LOGPATH)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    summarize(args.logpath, args.top)
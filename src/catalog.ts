@@ -0,0 +1,115 @@
+// compact catalog bundle from /api/catalog, see buildcatalogbundle in app.py
+type BundleCourse = {
+  i: number;
+  c: string;
+  t: string;
+  d: number;
+  p: string | null;
+  l: number | null;
+  n: number;
+  r?: number;
+  x?: number;
+  w?: number;
+  e?: number;
+};
+
+type Bundle = {
+  v: number;
+  d: string[];
+  c: BundleCourse[];
+};
+
+export type Course = {
+  id: number;
+  coursecode: string;
+  coursename: string;
+  department: string;
+  professor: string | null;
+  level: number | null;
+  reviewcount: number;
+  avgrating: number | null;
+  avgdifficulty: number | null;
+  avgworkload: number | null;
+  avginterest: number | null;
+};
+
+export type CatalogSort = "code" | "rating" | "reviews";
+
+export type CatalogFilters = {
+  search?: string;
+  department?: string;
+  level?: number;
+  minrating?: number;
+};
+
+// fetch follows the redirect to the hashed url, which the browser caches
+export async function loadCatalog(): Promise<Course[]> {
+  const response = await fetch("/api/catalog");
+  if (!response.ok) {
+    throw new Error(`catalog request failed: ${response.status}`);
+  }
+  const bundle: Bundle = await response.json();
+  return bundle.c.map((course) => ({
+    id: course.i,
+    coursecode: course.c,
+    coursename: course.t,
+    department: bundle.d[course.d],
+    professor: course.p,
+    level: course.l,
+    reviewcount: course.n,
+    avgrating: course.r ?? null,
+    avgdifficulty: course.x ?? null,
+    avgworkload: course.w ?? null,
+    avginterest: course.e ?? null,
+  }));
+}
+
+// same filters as the flask home page, run locally with no round trip
+export function filterCourses(courses: Course[], filters: CatalogFilters) {
+  const search = (filters.search ?? "").trim().toLowerCase();
+  return courses.filter((course) => {
+    if (filters.department && course.department !== filters.department) {
+      return false;
+    }
+    if (filters.level && course.level !== filters.level) {
+      return false;
+    }
+    if (filters.minrating && (course.avgrating ?? 0) < filters.minrating) {
+      return false;
+    }
+    if (
+      search &&
+      !course.coursecode.toLowerCase().includes(search) &&
+      !course.coursename.toLowerCase().includes(search) &&
+      !(course.professor ?? "").toLowerCase().includes(search)
+    ) {
+      return false;
+    }
+    return true;
+  });
+}
+
+// code order matches the flask page, rating and reviews put unreviewed courses last
+export function sortCourses(courses: Course[], sort: CatalogSort) {
+  const sorted = [...courses];
+  if (sort === "rating") {
+    sorted.sort(
+      (a, b) =>
+        (b.avgrating ?? -1) - (a.avgrating ?? -1) ||
+        b.reviewcount - a.reviewcount ||
+        a.coursecode.localeCompare(b.coursecode),
+    );
+  } else if (sort === "reviews") {
+    sorted.sort(
+      (a, b) =>
+        b.reviewcount - a.reviewcount || a.coursecode.localeCompare(b.coursecode),
+    );
+  } else {
+    sorted.sort(
+      (a, b) =>
+        a.department.localeCompare(b.department) ||
+        a.coursecode.localeCompare(b.coursecode),
+    );
+  }
+  return sorted;
+}
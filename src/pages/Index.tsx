@@ -1,4 +1,15 @@
+import { useEffect, useMemo, useState } from "react";
 import { Link } from "react-router-dom";
+import {
+  type CatalogSort,
+  type Course,
+  filterCourses,
+  loadCatalog,
+  sortCourses,
+} from "../catalog";
+
+// how many matches the list renders at once
+const SHOWLIMIT = 60;
 
 function Index() {
   const pages = [
@@ -24,6 +35,64 @@ function Index() {
     },
   ];
 
+  // whole catalog loads once, every filter and sort after that is local
+  const [courses, setCourses] = useState<Course[]>([]);
+  const [loaderror, setLoaderror] = useState("");
+  const [loading, setLoading] = useState(true);
+  const [search, setSearch] = useState("");
+  const [department, setDepartment] = useState("");
+  const [level, setLevel] = useState("");
+  const [minrating, setMinrating] = useState("");
+  const [sort, setSort] = useState<CatalogSort>("code");
+
+  useEffect(() => {
+    let active = true;
+    loadCatalog()
+      .then((loaded) => {
+        if (active) {
+          setCourses(loaded);
+        }
+      })
+      .catch(() => {
+        if (active) {
+          setLoaderror("could not load the course catalog.");
+        }
+      })
+      .finally(() => {
+        if (active) {
+          setLoading(false);
+        }
+      });
+    return () => {
+      active = false;
+    };
+  }, []);
+
+  const departments = useMemo(
+    () => [...new Set(courses.map((course) => course.department))].sort(),
+    [courses],
+  );
+  const levels = useMemo(
+    () =>
+      [...new Set(courses.map((course) => course.level))]
+        .filter((value): value is number => value !== null)
+        .sort((a, b) => a - b),
+    [courses],
+  );
+  const matches = useMemo(
+    () =>
+      sortCourses(
+        filterCourses(courses, {
+          search,
+          department,
+          level: level ? Number(level) : undefined,
+          minrating: minrating ? Number(minrating) : undefined,
+        }),
+        sort,
+      ),
+    [courses, search, department, level, minrating, sort],
+  );
+
   return (
     <main className="page">
       <section className="panel">
@@ -34,6 +103,96 @@ function Index() {
         </p>
       </section>
 
+      <section className="panel">
+        <h2>courses</h2>
+        {loading && <p>loading catalog...</p>}
+        {loaderror && <p>{loaderror}</p>}
+        {!loading && !loaderror && (
+          <>
+            <form className="simple-form" onSubmit={(event) => event.preventDefault()}>
+              <label htmlFor="search">search</label>
+              <input
+                id="search"
+                type="text"
+                value={search}
+                placeholder="name, code, or professor"
+                onChange={(event) => setSearch(event.target.value)}
+              />
+
+              <label htmlFor="department">department</label>
+              <select
+                id="department"
+                value={department}
+                onChange={(event) => setDepartment(event.target.value)}
+              >
+                <option value="">all departments</option>
+                {departments.map((name) => (
+                  <option key={name} value={name}>
+                    {name}
+                  </option>
+                ))}
+              </select>
+
+              <label htmlFor="level">level</label>
+              <select
+                id="level"
+                value={level}
+                onChange={(event) => setLevel(event.target.value)}
+              >
+                <option value="">all</option>
+                {levels.map((value) => (
+                  <option key={value} value={value}>
+                    {value}
+                  </option>
+                ))}
+              </select>
+
+              <label htmlFor="minrating">min rating</label>
+              <input
+                id="minrating"
+                type="number"
+                min="1"
+                max="5"
+                step="0.1"
+                value={minrating}
+                onChange={(event) => setMinrating(event.target.value)}
+              />
+
+              <label htmlFor="sort">sort by</label>
+              <select
+                id="sort"
+                value={sort}
+                onChange={(event) => setSort(event.target.value as CatalogSort)}
+              >
+                <option value="code">department and code</option>
+                <option value="rating">average rating</option>
+                <option value="reviews">review count</option>
+              </select>
+            </form>
+
+            <p>
+              matched {matches.length}
+              {matches.length > SHOWLIMIT && ` (showing ${SHOWLIMIT})`}
+            </p>
+            <div className="card-grid">
+              {matches.slice(0, SHOWLIMIT).map((course) => (
+                <article key={course.id} className="mini-card">
+                  <h3>{course.coursecode}</h3>
+                  <p>{course.coursename}</p>
+                  <p>
+                    {course.professor ?? "staff"} |{" "}
+                    {course.avgrating !== null
+                      ? `${course.avgrating} / 5 from ${course.reviewcount}`
+                      : "no reviews yet"}
+                  </p>
+                  <Link to={`/course/${course.id}`}>open course</Link>
+                </article>
+              ))}
+            </div>
+          </>
+        )}
+      </section>
+
       <section className="panel">
         <h2>pages</h2>
         <div className="card-grid">
@@ -0,0 +1,42 @@
+// fill the search box datalist from /api/suggest as the user types
+(function () {
+    var input = document.getElementById("search");
+    var list = document.getElementById("searchsuggestions");
+    if (!input || !list) {
+        return;
+    }
+    var latest = 0;
+    input.addEventListener("input", function () {
+        var query = input.value.trim();
+        var request = ++latest;
+        if (!query) {
+            list.innerHTML = "";
+            return;
+        }
+        fetch("/api/suggest?q=" + encodeURIComponent(query))
+            .then(function (response) {
+                return response.ok ? response.json() : { suggestions: [] };
+            })
+            .then(function (data) {
+                if (request !== latest) {
+                    // a newer keystroke already answered
+                    return;
+                }
+                list.innerHTML = "";
+                data.suggestions.forEach(function (item) {
+                    var option = document.createElement("option");
+                    if (item.type === "course") {
+                        option.value = item.code;
+                        option.label = item.title + " (" + item.reviews + " reviews)";
+                    } else {
+                        option.value = item.name;
+                        option.label = "Professor, " + item.courses + " courses";
+                    }
+                    list.appendChild(option);
+                });
+            })
+            .catch(function () {
+                // suggestions are optional, the form still submits normally
+            });
+    });
+})();
@@ -0,0 +1,169 @@
+from bisect import bisect_left
+import heapq
+import os
+import re
+import threading
+import time
+
+
+# ranking picks up new review counts at most this often, typeahead can lag a little
+SUGGESTREFRESH = float(os.environ.get("SUGGESTREFRESH", "60"))
+# prefixes matching more entries than this get their top list precomputed
+SCANLIMIT = 256
+# precomputed lists are cut at the largest limit the endpoint accepts
+TOPSIZE = 20
+# how many distinct queries each worker remembers answers for
+MEMOSIZE = 4096
+# sorts after every real character, so prefix + LASTCHAR bounds a prefix range
+LASTCHAR = "\U0010ffff"
+
+
+def words(text):
+    return re.findall(r"\w+", (text or "").casefold())
+
+
+# typeahead over course codes, title words, and professor names
+# keys are one sorted array with a parallel array of targets, so a prefix is two
+# bisects; targets are ("course", id) or ("professor", name)
+class SuggestIndex:
+    # rows carry (id, coursecode, coursename, professor)
+    def __init__(self, rows):
+        self.courses = {}
+        self.professors = {}
+        self.targetwords = {}
+        entries = []
+        for courseid, coursecode, coursename, professor in rows:
+            target = ("course", courseid)
+            self.courses[courseid] = (coursecode, coursename)
+            self.targetwords[target] = tuple(set(words(coursecode) + words(coursename)))
+            entries.extend((word, target) for word in self.targetwords[target])
+            if professor:
+                self.professors.setdefault(professor, []).append(courseid)
+        for name in self.professors:
+            target = ("professor", name)
+            self.targetwords[target] = tuple(set(words(name)))
+            entries.extend((word, target) for word in self.targetwords[target])
+
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.targets = [entry[1] for entry in entries]
+        # swapped together as one tuple: (scores, ranks, top lists, memo)
+        self.ranking = ({}, {}, {}, {})
+        self.scoresversion = None
+        self.refreshedat = None
+        self.refreshlock = threading.Lock()
+
+    # due when the data moved and the last refresh is old enough
+    def refreshdue(self, version):
+        if version == self.scoresversion:
+            return False
+        if self.refreshedat is None:
+            return True
+        return time.monotonic() - self.refreshedat >= SUGGESTREFRESH
+
+    # review counts move with the data version, the prefix arrays do not
+    def setcounts(self, counts, version):
+        if not self.refreshlock.acquire(blocking=False):
+            # another thread is already refreshing, keep serving the old ranking
+            return
+        try:
+            scores = {("course", courseid): count for courseid, count in counts.items()}
+            for name, courseids in self.professors.items():
+                scores[("professor", name)] = sum(counts.get(courseid, 0) for courseid in courseids)
+            # one total order, most reviewed first, then by code or name
+            ordered = sorted(
+                self.targetwords,
+                key=lambda target: (-scores.get(target, 0), self.label(target)),
+            )
+            ranks = {target: rank for rank, target in enumerate(ordered)}
+            self.ranking = (scores, ranks, self.buildtops(ranks), {})
+            self.scoresversion = version
+            self.refreshedat = time.monotonic()
+        finally:
+            self.refreshlock.release()
+
+    # top lists for every prefix too broad to scan per keystroke, walking each
+    # broad prefix one character deeper until its ranges get small
+    def buildtops(self, ranks):
+        tops = {}
+        pending = [(0, len(self.keys), 1)]
+        while pending:
+            start, end, length = pending.pop()
+            position = start
+            while position < end:
+                key = self.keys[position]
+                if len(key) < length:
+                    # the parent prefix itself, already covered one level up
+                    position += 1
+                    continue
+                prefix = key[:length]
+                stop = bisect_left(self.keys, prefix + LASTCHAR, position, end)
+                if stop - position > SCANLIMIT:
+                    tops[prefix] = heapq.nsmallest(
+                        TOPSIZE, set(self.targets[position:stop]), key=ranks.__getitem__
+                    )
+                    pending.append((position, stop, length + 1))
+                position = stop
+        return tops
+
+    # targets that have a word starting with prefix
+    def prefixtargets(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + LASTCHAR, start)
+        return set(self.targets[start:end])
+
+    # top matches by review count, every query word must prefix some word of the match
+    def suggest(self, query, limit):
+        tokens = tuple(words(query))
+        if not tokens:
+            return []
+        # one consistent snapshot even if another thread swaps in new counts
+        scores, ranks, tops, memo = self.ranking
+        memokey = (tokens, limit)
+        found = memo.get(memokey)
+        if found is not None:
+            return found
+
+        if len(tokens) == 1 and tokens[0] in tops:
+            best = tops[tokens[0]][:limit]
+        else:
+            # the longest word narrows the range the most, the rest filter it
+            candidates = self.prefixtargets(max(tokens, key=len))
+            if len(tokens) > 1:
+                candidates = [
+                    target
+                    for target in candidates
+                    if all(
+                        any(word.startswith(token) for word in self.targetwords[target])
+                        for token in tokens
+                    )
+                ]
+            best = heapq.nsmallest(limit, candidates, key=lambda target: ranks.get(target, 0))
+        results = [self.describe(target, scores.get(target, 0)) for target in best]
+
+        if len(memo) >= MEMOSIZE:
+            memo.clear()
+        memo[memokey] = results
+        return results
+
+    def label(self, target):
+        if target[0] == "course":
+            return self.courses[target[1]][0]
+        return target[1]
+
+    def describe(self, target, reviews):
+        if target[0] == "course":
+            coursecode, coursename = self.courses[target[1]]
+            return {
+                "type": "course",
+                "id": target[1],
+                "code": coursecode,
+                "title": coursename,
+                "reviews": reviews,
+            }
+        return {
+            "type": "professor",
+            "name": target[1],
+            "courses": len(self.professors[target[1]]),
+            "reviews": reviews,
+        }
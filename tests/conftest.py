@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# one seeded db per test run, built by initdb the same way a deploy builds it
+@pytest.fixture(scope="session")
+def appmodule(tmp_path_factory):
+    os.environ["COURSEDBPATH"] = str(tmp_path_factory.mktemp("db") / "courses.db")
+    import initdb
+
+    initdb.CATALOGCSVPATH = os.path.join(ROOT, initdb.CATALOGCSVPATH)
+    initdb.builddatabase()
+    import app
+
+    return app
+
+
+@pytest.fixture
+def client(appmodule):
+    return appmodule.app.test_client()
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+
+def busiestcourse(appmodule):
+    con = sqlite3.connect(appmodule.getdbpath())
+    try:
+        return con.execute(
+            "SELECT courseid FROM reviews GROUP BY courseid ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()[0]
+    finally:
+        con.close()
+
+
+# crafted cursors used to reach sqlite as parameters and 500
+@pytest.mark.parametrize(
+    "values",
+    [
+        [["2025-01-01"], 1],
+        [{"a": 1}, 1],
+        ["2025-01-01", [1]],
+        ["2025-01-01", 2**63],
+        ["2025-01-01", -(2**63) - 1],
+        ["2025-01-01", 1.5],
+        ["2025-01-01", True],
+        [None, 1],
+        ["\ud800", 1],
+    ],
+)
+@pytest.mark.parametrize("name", ["after", "before"])
+def test_malformed_review_cursor_restarts_at_page_one(appmodule, client, name, values):
+    courseid = busiestcourse(appmodule)
+    firstpage = client.get(f"/course/{courseid}")
+    cursor = appmodule.encodecursor(values)
+    response = client.get(f"/course/{courseid}?{name}={cursor}")
+    assert response.status_code == 200
+    assert response.data == firstpage.data
+
+
+# statements fts5 issues on its own while answering a MATCH against the catalog
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "PRAGMA 'catalog'.data_version",
+        "SELECT k, v FROM 'catalog'.'coursesearch_config'",
+        "SELECT pgno FROM 'main'.'coursesearch_idx' WHERE segid=? AND term<=? ORDER BY term DESC LIMIT 1",
+        "REPLACE INTO 'main'.'coursesearch_data'(id, block) VALUES(?,?)",
+        "-- SELECT sz FROM 'catalog'.'coursesearch_docsize' WHERE id=?",
+    ],
+)
+def test_fts_internal_statements_are_not_app_statements(statement):
+    import metrics
+
+    assert not metrics.isappstatement(statement)
+
+
+def test_search_counts_only_app_statements(appmodule, client):
+    from benchmark import runner
+
+    # warm the catalog index and search table check
+    assert client.get("/?search=calculus").status_code == 200
+    # a fresh connection makes fts5 read its config again, and pooled
+    # connections predate the hook anyway
+    while not appmodule.connectionpool.empty():
+        appmodule.closeconnection(appmodule.connectionpool.get_nowait()[1])
+    appmodule.connectionhooks.append(runner.tracehook)
+    try:
+        runner.querycounter.count = 0
+        assert client.get("/?search=writing").status_code == 200
+    finally:
+        appmodule.connectionhooks.remove(runner.tracehook)
+    # data version, the fts MATCH, and hydrating the page of courses
+    assert runner.querycounter.count == 3
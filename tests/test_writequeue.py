@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+
+from writequeue import GroupCommitWriter
+
+
+def test_writer_survives_a_failing_batch(tmp_path):
+    dbpath = str(tmp_path / "writes.db")
+    setup = sqlite3.connect(dbpath)
+    setup.execute("CREATE TABLE rows (value INTEGER)")
+    setup.commit()
+    setup.close()
+
+    def writebatch(con, rows):
+        con.executemany("INSERT INTO rows (value) VALUES (?)", [(row,) for row in rows])
+        if "bad" in rows:
+            raise ValueError("bad row")
+
+    writer = GroupCommitWriter(
+        "test", lambda: sqlite3.connect(dbpath, check_same_thread=False), writebatch
+    )
+    with pytest.raises(ValueError):
+        writer.submit("bad")
+    # the next batch still commits, so the failed one was rolled back
+    writer.submit(1)
+    assert writer.thread.is_alive()
+
+    con = sqlite3.connect(dbpath)
+    assert con.execute("SELECT value FROM rows").fetchall() == [(1,)]
+    con.close()
+    assert writer.writerstats()["failures"] == 1
@@ -6,6 +6,10 @@ export default defineConfig({
   server: {
     host: "::",
     port: 8080,
+    // api calls go to the flask dev server
+    proxy: {
+      "/api": "http://127.0.0.1:5000",
+    },
   },
   plugins: [react()],
 });
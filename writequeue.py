@@ -0,0 +1,177 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+
+# a batch flushes after this many ms or once it holds this many rows
+WRITEBATCHMS = float(os.environ.get("WRITEBATCHMS", "5"))
+WRITEBATCHROWS = int(os.environ.get("WRITEBATCHROWS", "50"))
+# busy retries per batch, starting backoff in ms, doubled each time
+WRITERETRIES = int(os.environ.get("WRITERETRIES", "5"))
+WRITEBACKOFFMS = float(os.environ.get("WRITEBACKOFFMS", "10"))
+# short busy timeout on the writer so lock waits turn into backoff we control
+WRITEBUSYMS = int(os.environ.get("WRITEBUSYMS", "50"))
+# rows allowed to wait for the writer, and how long a request waits for its batch
+WRITEQUEUE = int(os.environ.get("WRITEQUEUE", "1000"))
+WRITETIMEOUT = float(os.environ.get("WRITETIMEOUT", "30"))
+
+
+# raised when the queue is full or the batch did not land in time, maps to a 503
+class WriteBusy(Exception):
+    pass
+
+
+# one queued row plus the event its request waits on
+class PendingWrite:
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+
+
+def isbusy(error):
+    return getattr(error, "sqlite_errorcode", None) in {
+        sqlite3.SQLITE_BUSY,
+        sqlite3.SQLITE_LOCKED,
+    }
+
+
+# group commit: requests queue rows, one writer thread per worker commits them
+# in shared transactions so concurrent posts pay for one fsync and one lock
+# batches only merge when a worker serves several requests at once, which is
+# why gunicorn.conf.py runs threaded workers
+# isstale(con) says when the writer's connection must be reopened before a batch
+class GroupCommitWriter:
+    def __init__(self, name, openconnection, writebatch, isstale=None):
+        self.name = name
+        self.openconnection = openconnection
+        self.writebatch = writebatch
+        self.isstale = isstale
+        self.pending = queue.Queue(maxsize=WRITEQUEUE)
+        self.thread = None
+        self.con = None
+        self.lock = threading.Lock()
+        self.stats = {
+            "batches": 0,
+            "rows": 0,
+            "largestbatch": 0,
+            "retries": 0,
+            "failures": 0,
+            "busy": 0,
+            "timeouts": 0,
+        }
+
+    # start the writer on first use, after gunicorn has forked this worker
+    def ensurewriter(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=f"{self.name}writer", daemon=True
+                )
+                self.thread.start()
+
+    def countstat(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    # queue one row and block until its batch commits, raises on failure
+    def submit(self, row):
+        self.ensurewriter()
+        pending = PendingWrite(row)
+        try:
+            self.pending.put_nowait(pending)
+        except queue.Full:
+            self.countstat("busy")
+            raise WriteBusy()
+        if not pending.done.wait(WRITETIMEOUT):
+            # the row may still land later, the caller just stops waiting
+            self.countstat("timeouts")
+            raise WriteBusy()
+        if pending.error is not None:
+            raise pending.error
+
+    # collect rows until the batch is full or its first row is WRITEBATCHMS old
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + WRITEBATCHMS / 1000
+            while len(batch) < WRITEBATCHROWS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.flush(batch)
+
+    def getconnection(self):
+        if self.con is not None and self.isstale is not None and self.isstale(self.con):
+            # e.g. a new catalog file was published since this connection attached
+            self.dropconnection()
+        if self.con is None:
+            self.con = self.openconnection()
+            self.con.execute(f"PRAGMA busy_timeout = {WRITEBUSYMS}")
+            # normal skips the fsync on wal commits, full makes a finished wait durable
+            self.con.execute("PRAGMA synchronous = FULL")
+        return self.con
+
+    def dropconnection(self):
+        if self.con is not None:
+            try:
+                self.con.close()
+            except sqlite3.Error:
+                pass
+            self.con = None
+
+    # one transaction for the whole batch, busy errors back off and retry
+    def flush(self, batch):
+        rows = [pending.row for pending in batch]
+        error = None
+        for attempt in range(WRITERETRIES + 1):
+            try:
+                con = self.getconnection()
+                # take the write lock up front so busy shows up before any work
+                con.execute("BEGIN IMMEDIATE")
+                self.writebatch(con, rows)
+                con.commit()
+                error = None
+                break
+            except Exception as caught:
+                # anything writebatch raises fails this batch only, the writer
+                # thread has to live on and the transaction must not stay open
+                error = caught
+                try:
+                    if self.con is not None:
+                        self.con.rollback()
+                except sqlite3.Error:
+                    # connection is unusable, open a new one next attempt
+                    self.dropconnection()
+                if not isbusy(caught) or attempt == WRITERETRIES:
+                    break
+                self.countstat("retries")
+                backoff = WRITEBACKOFFMS * (2**attempt) / 1000
+                # jitter keeps writers in other workers from retrying in lockstep
+                time.sleep(backoff * random.uniform(0.5, 1.0))
+
+        with self.lock:
+            if error is None:
+                self.stats["batches"] += 1
+                self.stats["rows"] += len(rows)
+                self.stats["largestbatch"] = max(self.stats["largestbatch"], len(rows))
+            else:
+                self.stats["failures"] += 1
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+    def writerstats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.pending.qsize()
+        stats["batchms"] = WRITEBATCHMS
+        stats["batchrows"] = WRITEBATCHROWS
+        return stats